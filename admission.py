@@ -0,0 +1,268 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Optional shared state for multi-worker deployments
+try:
+    import redis
+except ImportError:
+    redis = None
+
+class AdmissionRejected(Exception):
+    """Raised when a model call is shed instead of being admitted"""
+
+    def __init__(self, reason):
+        super().__init__(f"Model call rejected: {reason}")
+        self.reason = reason
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self, amount=1):
+        """Take `amount` tokens if available and report whether it worked"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+class LocalBucketStore:
+    """Token buckets held in this process, shared by all of its threads"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key, rate, capacity, amount=1):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(rate, capacity)
+                self._buckets[key] = bucket
+                # Forget the least recently seen clients so memory stays bounded
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.try_acquire(amount)
+
+class RedisBucketStore:
+    """Token buckets kept in Redis so every gunicorn worker shares one budget
+
+    While Redis can't be reached each worker falls back to its own
+    in-process buckets, so an outage loosens the limits instead of failing
+    every model call.
+    """
+
+    SCRIPT = """
+    local tokens_key = KEYS[1]
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local amount = tonumber(ARGV[4])
+    local state = redis.call('HMGET', tokens_key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= amount then
+        tokens = tokens - amount
+        allowed = 1
+    end
+    redis.call('HSET', tokens_key, 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', tokens_key, math.ceil(capacity / rate) + 1)
+    return allowed
+    """
+
+    def __init__(self, url, prefix="objectchat:bucket:", timeout=0.5):
+        if redis is None:
+            raise RuntimeError("redis package is not installed: pip install redis")
+        # A short timeout so a stalled Redis costs each request little before falling back
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+        self.fallback = LocalBucketStore()
+        self.errors = 0
+
+    def try_acquire(self, key, rate, capacity, amount=1):
+        try:
+            allowed = self._script(keys=[self.prefix + key], args=[rate, capacity, time.time(), amount])
+        except Exception as e:
+            self.errors += 1
+            print(f"Error reading shared rate limit state, using in-process buckets: {e}")
+            return self.fallback.try_acquire(key, rate, capacity, amount)
+        return bool(allowed)
+
+class _Ticket:
+    """A queued request waiting for a concurrency slot"""
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+class AdmissionController:
+    """Rate limiting, bounded concurrency and fair queuing in front of the model backend
+
+    Each client has its own token bucket and all clients share a global one.
+    Admitted calls then need one of `max_concurrency` slots; when none is free
+    the call waits in a per-client queue and slots are handed out round-robin
+    across clients, so one busy client can't starve the rest.
+    """
+
+    def __init__(self, user_rate=0.5, user_burst=5, global_rate=20.0, global_burst=40,
+                 max_concurrency=8, queue_timeout=10.0, max_queue=100, store=None):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.store = store or LocalBucketStore()
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._queues = OrderedDict()  # client key -> deque of tickets
+        self.counters = {
+            "admitted": 0,
+            "queued": 0,
+            "shed_user_rate": 0,
+            "shed_global_rate": 0,
+            "shed_queue_full": 0,
+            "shed_queue_timeout": 0
+        }
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    def _count(self, name):
+        with self._cond:
+            self.counters[name] += 1
+
+    def charge(self, client_key):
+        """Take one token from the client's and the global bucket or raise AdmissionRejected"""
+        if not self.store.try_acquire(f"user:{client_key}", self.user_rate, self.user_burst):
+            self._count("shed_user_rate")
+            raise AdmissionRejected("per-client rate limit exceeded")
+        if not self.store.try_acquire("global", self.global_rate, self.global_burst):
+            self._count("shed_global_rate")
+            raise AdmissionRejected("global rate limit exceeded")
+
+    @contextmanager
+    def admit(self, client_key, charge=True):
+        """Hold a model-call slot for `client_key` or raise AdmissionRejected
+
+        Pass charge=False when the rate limit was already paid with charge(),
+        e.g. for a batched call made on behalf of several clients.
+        """
+        if charge:
+            self.charge(client_key)
+
+        self._acquire_slot(client_key)
+        try:
+            yield
+        finally:
+            self._release_slot()
+
+    def _acquire_slot(self, client_key):
+        with self._cond:
+            if self._active < self.max_concurrency and not self._queues:
+                self._active += 1
+                self.counters["admitted"] += 1
+                return
+
+            if self._queued >= self.max_queue:
+                self.counters["shed_queue_full"] += 1
+                raise AdmissionRejected("admission queue is full")
+
+            ticket = _Ticket()
+            self._queues.setdefault(client_key, deque()).append(ticket)
+            self._queued += 1
+            self.counters["queued"] += 1
+            started = time.monotonic()
+            deadline = started + self.queue_timeout
+
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._abandon(client_key, ticket)
+                    self.counters["shed_queue_timeout"] += 1
+                    raise AdmissionRejected("timed out waiting for a model slot")
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - started
+            self._queue_wait_total += waited
+            self._queue_wait_max = max(self._queue_wait_max, waited)
+            self.counters["admitted"] += 1
+
+    def _abandon(self, client_key, ticket):
+        """Drop a ticket whose deadline passed (caller holds the lock)"""
+        queue = self._queues.get(client_key)
+        if queue is not None:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[client_key]
+        self._queued -= 1
+
+    def _release_slot(self):
+        with self._cond:
+            self._active -= 1
+            # Hand free slots out one client at a time, in round-robin order
+            while self._active < self.max_concurrency and self._queues:
+                client_key, queue = next(iter(self._queues.items()))
+                ticket = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(client_key)
+                else:
+                    del self._queues[client_key]
+                ticket.granted = True
+                self._active += 1
+                self._queued -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """Snapshot of admission counters and current load"""
+        with self._cond:
+            admitted_after_wait = self.counters["queued"] - self.counters["shed_queue_timeout"] - self._queued
+            return {
+                **self.counters,
+                "active": self._active,
+                "waiting": self._queued,
+                "waiting_clients": len(self._queues),
+                "max_concurrency": self.max_concurrency,
+                "avg_queue_wait_ms": round(1000 * self._queue_wait_total / admitted_after_wait, 2) if admitted_after_wait > 0 else 0.0,
+                "max_queue_wait_ms": round(1000 * self._queue_wait_max, 2)
+            }
+
+def create_admission_controller():
+    """Build the admission controller from environment variables"""
+    store = None
+    redis_url = os.getenv("RATE_LIMIT_REDIS_URL")
+    if redis_url:
+        try:
+            store = RedisBucketStore(redis_url)
+            print("Using Redis for shared rate limit state")
+        except Exception as e:
+            print(f"Could not use Redis for rate limiting, falling back to in-process buckets: {e}")
+
+    return AdmissionController(
+        user_rate=float(os.getenv("LLM_USER_RATE", "0.5")),
+        user_burst=float(os.getenv("LLM_USER_BURST", "5")),
+        global_rate=float(os.getenv("LLM_GLOBAL_RATE", "20")),
+        global_burst=float(os.getenv("LLM_GLOBAL_BURST", "40")),
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", "100")),
+        store=store
+    )
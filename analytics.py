@@ -0,0 +1,217 @@
+import time
+import argparse
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, ChatSession, ObjectPopularity, UserObject, ObjectCooccurrence, AnalyticsWatermark
+
+ROLLUP_WATERMARK = "chat_session_rollups"
+
+# Sessions younger than this are left for the next run, so a transaction that
+# took a lower id but commits late isn't skipped by the watermark
+SETTLE_SECONDS = 60
+
+# Daily popularity buckets older than this are deleted
+RETENTION_DAYS = 90
+
+def _primary():
+    # Rollups must read their own previous writes, which a lagging replica may not have yet
+    return {"bind": db.engine}
+
+def _upsert(model, rows, keys, add=None):
+    """Insert rows, adding `add` to the existing value (or skipping the row) on conflict"""
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(model)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(model)
+    else:
+        raise RuntimeError(f"Unsupported database: {dialect}")
+    if add:
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_={add: getattr(model, add) + stmt.excluded[add]})
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=keys)
+    db.session.execute(stmt, rows)
+
+def update_rollups(batch_size=500, settle_seconds=SETTLE_SECONDS):
+    """Fold the next batch of new chat sessions into the popularity and co-occurrence tables
+
+    Returns the number of sessions processed; 0 once caught up. Safe to run
+    from several processes: a batch only commits if it advances the
+    watermark it started from.
+    """
+    _upsert(AnalyticsWatermark, [{"name": ROLLUP_WATERMARK, "value": 0}], ["name"])
+    db.session.commit()
+    last_id = db.session.execute(
+        select(AnalyticsWatermark.value).where(AnalyticsWatermark.name == ROLLUP_WATERMARK),
+        bind_arguments=_primary()
+    ).scalar()
+
+    settled = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    rows = []
+    for row in db.session.execute(
+        select(ChatSession.id, ChatSession.user_id, ChatSession.object_name, ChatSession.created_at)
+        .where(ChatSession.id > last_id)
+        .order_by(ChatSession.id)
+        .limit(batch_size),
+        bind_arguments=_primary()
+    ):
+        if row.created_at and row.created_at > settled:
+            break
+        rows.append(row)
+    if not rows:
+        db.session.rollback()
+        return 0
+
+    # Claim the batch first; a concurrent run that got here earlier makes this match nothing
+    claimed = db.session.execute(
+        update(AnalyticsWatermark)
+        .where(AnalyticsWatermark.name == ROLLUP_WATERMARK, AnalyticsWatermark.value == last_id)
+        .values(value=rows[-1].id, updated_at=datetime.utcnow())
+    ).rowcount
+    if claimed != 1:
+        db.session.rollback()
+        return 0
+
+    known = defaultdict(set)
+    for user_id, object_name in db.session.execute(
+        select(UserObject.user_id, UserObject.object_name)
+        .where(UserObject.user_id.in_({row.user_id for row in rows})),
+        bind_arguments=_primary()
+    ):
+        known[user_id].add(object_name)
+
+    popularity = Counter()
+    pairs = Counter()
+    new_user_objects = []
+    for row in rows:
+        popularity[(row.object_name, (row.created_at or datetime.utcnow()).date())] += 1
+        seen = known[row.user_id]
+        if row.object_name in seen:
+            continue
+        for other in seen:
+            pairs[(row.object_name, other)] += 1
+            pairs[(other, row.object_name)] += 1
+        seen.add(row.object_name)
+        new_user_objects.append({"user_id": row.user_id, "object_name": row.object_name,
+                                 "first_chat_at": row.created_at})
+
+    # Sorted so concurrent writers always lock rows in the same order
+    _upsert(ObjectPopularity, [
+        {"object_name": name, "day": day, "chat_count": count}
+        for (name, day), count in sorted(popularity.items())
+    ], ["object_name", "day"], add="chat_count")
+    _upsert(UserObject, new_user_objects, ["user_id", "object_name"])
+    _upsert(ObjectCooccurrence, [
+        {"object_name": name, "related_name": related, "user_count": count}
+        for (name, related), count in sorted(pairs.items())
+    ], ["object_name", "related_name"], add="user_count")
+    db.session.commit()
+    return len(rows)
+
+def catch_up(batch_size=500, max_batches=None):
+    """Run update_rollups until it is caught up (or `max_batches` ran); returns sessions processed"""
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        processed = update_rollups(batch_size)
+        if not processed:
+            break
+        total += processed
+        batches += 1
+    return total
+
+def prune_popularity(retention_days=RETENTION_DAYS):
+    """Delete daily buckets that have fallen out of every rolling window"""
+    cutoff = datetime.utcnow().date() - timedelta(days=retention_days)
+    deleted = db.session.execute(delete(ObjectPopularity).where(ObjectPopularity.day < cutoff)).rowcount
+    db.session.commit()
+    return deleted
+
+def popular_objects(days=7, limit=10):
+    """Objects with the most new chats over the last `days` days, most popular first"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    chats = func.sum(ObjectPopularity.chat_count).label("chats")
+    return [name for name, _ in db.session.execute(
+        select(ObjectPopularity.object_name, chats)
+        .where(ObjectPopularity.day >= since)
+        .group_by(ObjectPopularity.object_name)
+        .order_by(chats.desc(), ObjectPopularity.object_name)
+        .limit(limit)
+    )]
+
+def related_objects(object_name, limit=10):
+    """Objects most often chatted with by users who also chatted with `object_name`"""
+    return db.session.execute(
+        select(ObjectCooccurrence.related_name)
+        .where(ObjectCooccurrence.object_name == object_name)
+        .order_by(ObjectCooccurrence.user_count.desc(), ObjectCooccurrence.related_name)
+        .limit(limit)
+    ).scalars().all()
+
+class Prewarmer:
+    """Background thread that keeps the rollups current and the most popular personas cached
+
+    Every `interval` seconds it folds new chats into the rollups and calls
+    `warm_fn(name)` for the `top_k` most popular objects of the last `days`
+    days, so their personas are cached before users ask for them.
+    """
+
+    def __init__(self, app, warm_fn, top_k=20, days=7, interval=300):
+        self.app = app
+        self.warm_fn = warm_fn
+        self.top_k = top_k
+        self.days = days
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"runs": 0, "sessions_processed": 0, "warmed": 0, "errors": 0}
+
+    def start(self):
+        # Started lazily so each gunicorn worker gets its own thread after fork
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="prewarmer", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Error refreshing rollups and prewarming personas: {e}")
+            time.sleep(self.interval)
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                self.stats["sessions_processed"] += catch_up()
+                if self.stats["runs"] % 100 == 0:
+                    prune_popularity()
+                names = popular_objects(self.days, self.top_k)
+            finally:
+                db.session.remove()
+        for name in names:
+            if self.warm_fn(name):
+                self.stats["warmed"] += 1
+        self.stats["runs"] += 1
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Update the popularity and co-occurrence rollups")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--prune", action="store_true", help=f"delete daily counts older than {RETENTION_DAYS} days")
+    parser.add_argument("--top", type=int, default=10, help="print this many popular objects afterwards")
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        print(f"Processed {catch_up(args.batch_size)} new chat sessions")
+        if args.prune:
+            print(f"Deleted {prune_popularity()} old daily counts")
+        for name in popular_objects(limit=args.top):
+            related = ", ".join(related_objects(name, 5))
+            print(f"  {name}" + (f" (also: {related})" if related else ""))
@@ -1,21 +1,53 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, has_request_context, make_response, Response, stream_with_context
+from markupsafe import Markup
+from sqlalchemy import event, select, insert, update, delete, text, func
 import os
+import time
 from dotenv import load_dotenv
-import re
 import json
+import zlib
 import random
 import requests
 import tempfile
+from functools import wraps
+from urllib.parse import urlparse
 from datetime import datetime, timedelta
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_wtf.csrf import CSRFProtect
+from werkzeug.middleware.proxy_fix import ProxyFix
+from flask_wtf.csrf import CSRFProtect, generate_csrf
 # from flask_session import Session  # Comment out Flask-Session
 from flask_migrate import Migrate
 
 # Import models and forms
-from models import db, User, ChatSession, ChatMessage
+from models import db, User, ChatSession, ChatMessage, ChatArchive
+from column_types import configure_storage_format
 from forms import LoginForm, RegistrationForm
+from object_names import normalize_object_name, parse_chat_command, PersonaIndex
+from admission import AdmissionRejected, create_admission_controller
+from persona_batcher import PersonaBatcher, build_batch_prompt, parse_batch_response
+from persona_schema import (PERSONA_FIELDS, PERSONA_BATCH_SCHEMA, JsonStreamParser, persona_schema, validate_persona,
+                            build_persona_prompt, build_repair_prompt)
+from persona_worker import PersonaWorker
+from db_config import REPLICA_BIND, configure_database, pool_stats
+from cache import create_cache
+from stub_model import StubModel
+from model_router import ModelRouter
+from profiler import RequestProfiler, collapsed_stacks
+from purge import purge_chat_session, count_messages, cascades_enabled
+from archive import rehydrate_session
+from analytics import Prewarmer, popular_objects, related_objects
+from chat_export import export_records, ndjson_chunks, gzip_chunks, read_records, import_records, parse_cursor, CHUNK_SIZE
+from http_cache import init_compression, chat_validators, is_not_modified, set_validators
+from chat_connections import ChatConnection, ConnectionRegistry
+from health_probe import HealthProber
+
+# Optional WebSocket transport for chat
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
 
 # Load environment variables
 load_dotenv()
@@ -23,7 +55,8 @@ load_dotenv()
 # Google Cloud Vertex AI configuration
 GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID", "")
 GCP_LOCATION = os.getenv("GCP_LOCATION", "us-central1")
-MODEL_ID = "gemini-2.0-flash-lite-001"  # Using Gemini 2.0 Flash Lite model for faster inference
+MODEL_ID = os.getenv("MODEL_FAST", "gemini-2.0-flash-lite-001")  # Fast model for short chat turns
+MODEL_LARGE_ID = os.getenv("MODEL_LARGE", "gemini-2.0-flash-001")  # Persona generation, long prompts and fallback
 
 # Flag to track if Vertex AI is initialized
 vertex_ai_initialized = False
@@ -32,7 +65,7 @@ vertex_ai_initialized = False
 try:
     print("Attempting to import Vertex AI modules...")
     import vertexai
-    from vertexai.generative_models import GenerativeModel
+    from vertexai.generative_models import GenerativeModel, GenerationConfig
     from google.cloud import aiplatform
     from google.oauth2 import service_account
     print("Successfully imported Vertex AI modules")
@@ -104,6 +137,17 @@ except Exception as e:
 # Model ID for Gemini Pro
 # Already initialized Vertex AI above
 
+# MODEL_BACKEND=stub swaps Vertex AI for local stub models (benchmarks, offline development)
+stub_models = None
+if os.getenv("MODEL_BACKEND", "vertex").lower() == "stub":
+    print("Using local stub models instead of Vertex AI")
+    stub_latency = float(os.getenv("STUB_MODEL_LATENCY", "0.3"))
+    stub_models = {
+        MODEL_ID: StubModel(latency=stub_latency),
+        MODEL_LARGE_ID: StubModel(latency=3 * stub_latency, per_token_latency=0.004)
+    }
+    vertex_ai_initialized = True
+
 # Template responses for when models are not available
 template_responses = {
     "lamp": [
@@ -136,15 +180,48 @@ template_responses = {
     ]
 }
 
+# Rate limiting and fair queuing for model calls
+admission = create_admission_controller()
+
+def current_client_key():
+    """Identify who a model call is made on behalf of, for rate limiting"""
+    if not has_request_context():
+        return "system"
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    # remote_addr is only taken from X-Forwarded-For as far as our own proxies (PROXY_HOPS) vouch for it
+    return f"ip:{request.remote_addr}"
+
 # Function to query the Vertex AI API
-def query_vertex_ai(prompt, temperature=0.7, max_output_tokens=256, top_p=0.8, is_chat=False):
-    """Send a request to the Vertex AI API using Gemini model with detailed debugging"""
+def query_vertex_ai(prompt, temperature=0.7, max_output_tokens=256, top_p=0.8, is_chat=False,
+                    client_key=None, precharged=False, task="chat", response_schema=None):
+    """Send a request to the model picked by the router for `task`, subject to admission control"""
     if not vertex_ai_initialized:
         print("Vertex AI not initialized. Using fallback responses.")
         return None
     
     try:
-        print(f"\n=== VERTEX AI REQUEST ===")
+        with admission.admit(client_key or current_client_key(), charge=not precharged):
+            return model_router.generate(task, prompt, temperature=temperature, max_output_tokens=max_output_tokens,
+                                         top_p=top_p, is_chat=is_chat, response_schema=response_schema)
+    except AdmissionRejected as e:
+        print(f"{e}. Using fallback response.")
+        return None
+
+def _generation_config(temperature, max_output_tokens, top_p, response_schema=None):
+    """Generation parameters, constrained to JSON matching `response_schema` when one is given"""
+    if response_schema is None:
+        return {"temperature": temperature, "max_output_tokens": max_output_tokens, "top_p": top_p}
+    return GenerationConfig(temperature=temperature, max_output_tokens=max_output_tokens, top_p=top_p,
+                            response_mime_type="application/json", response_schema=response_schema)
+
+def _call_vertex_ai(model_id, prompt, temperature, max_output_tokens, top_p, is_chat, response_schema=None):
+    """Send a request to the Vertex AI API using Gemini model with detailed debugging"""
+    try:
+        if stub_models is not None:
+            return stub_models[model_id].generate(prompt, max_output_tokens)
+        
+        print(f"\n=== VERTEX AI REQUEST ({model_id}) ===")
         print(f"Prompt type: {type(prompt)}")
         if isinstance(prompt, str):
             print(f"Prompt length: {len(prompt)} characters")
@@ -157,7 +234,7 @@ def query_vertex_ai(prompt, temperature=0.7, max_output_tokens=256, top_p=0.8, i
         if is_chat:
             # Create a chat model instance
             print("Creating chat model instance")
-            model = GenerativeModel(MODEL_ID)
+            model = GenerativeModel(model_id)
             chat = model.start_chat()
             
             # Send the message and get the response
@@ -174,14 +251,10 @@ def query_vertex_ai(prompt, temperature=0.7, max_output_tokens=256, top_p=0.8, i
         else:
             # Create a model instance
             print("Creating standard model instance")
-            model = GenerativeModel(MODEL_ID)
+            model = GenerativeModel(model_id)
             
             # Configure generation parameters
-            generation_config = {
-                "temperature": temperature,
-                "max_output_tokens": max_output_tokens,
-                "top_p": top_p
-            }
+            generation_config = _generation_config(temperature, max_output_tokens, top_p, response_schema)
             
             # Generate content
             print("Using standard mode for Vertex AI request")
@@ -205,6 +278,42 @@ def query_vertex_ai(prompt, temperature=0.7, max_output_tokens=256, top_p=0.8, i
         print("Using fallback response due to API error")
         return None
 
+def _stream_vertex_ai(model_id, prompt, temperature, max_output_tokens, top_p, response_schema=None):
+    """Yield response chunks from one model; errors are left to the router"""
+    if stub_models is not None:
+        yield from stub_models[model_id].generate_stream(prompt, max_output_tokens)
+        return
+    model = GenerativeModel(model_id)
+    generation_config = _generation_config(temperature, max_output_tokens, top_p, response_schema)
+    for chunk in model.generate_content(prompt, generation_config=generation_config, stream=True):
+        if chunk.text:
+            yield chunk.text
+
+# Picks the model for each call and falls back between them (see model_router.py)
+model_router = ModelRouter(
+    {"fast": MODEL_ID, "large": MODEL_LARGE_ID},
+    call_fn=_call_vertex_ai,
+    stream_fn=_stream_vertex_ai,
+    long_prompt_chars=int(os.getenv('ROUTER_LONG_PROMPT_CHARS', '4000')),
+    latency_slo={
+        "fast": float(os.getenv('MODEL_FAST_SLO_MS', '3000')) / 1000.0,
+        "large": float(os.getenv('MODEL_LARGE_SLO_MS', '10000')) / 1000.0
+    }
+)
+
+def stream_vertex_ai(prompt, temperature=0.9, max_output_tokens=150, top_p=0.9, client_key=None,
+                     precharged=False, task="chat", response_schema=None):
+    """Yield the response text in chunks as the model produces it, subject to admission control"""
+    if not vertex_ai_initialized:
+        return
+    
+    try:
+        with admission.admit(client_key or current_client_key(), charge=not precharged):
+            yield from model_router.stream(task, prompt, temperature=temperature, max_output_tokens=max_output_tokens,
+                                           top_p=top_p, response_schema=response_schema)
+    except AdmissionRejected as e:
+        print(f"{e}. Using fallback response.")
+
 # Function to get a random template response
 def get_template_response(object_name):
     """Get a random template response for the given object"""
@@ -221,11 +330,15 @@ def get_template_response(object_name):
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-for-testing')
 
-# Database configuration - handle Heroku-style PostgreSQL URLs
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
-    'DATABASE_URL', 
-    'sqlite:///object_chat.db'
-).replace('postgres://', 'postgresql://', 1)
+# Number of reverse proxies in front of the app; their X-Forwarded-For entries are trusted,
+# anything further left was written by the client
+PROXY_HOPS = int(os.getenv('PROXY_HOPS', '0'))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS, x_proto=PROXY_HOPS)
+
+# Database configuration - handle Heroku-style PostgreSQL URLs, pool sizing
+# and an optional read replica (DATABASE_REPLICA_URL)
+configure_database(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Configure sessions for persistent logins
@@ -238,6 +351,22 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 db.init_app(app)
 migrate = Migrate(app, db)
 
+# Compress JSON and HTML responses
+init_compression(app)
+
+# Opt-in sampling profiler for slow requests (nothing is installed unless enabled)
+request_profiler = None
+if os.getenv('PROFILING_ENABLED', 'False').lower() == 'true':
+    request_profiler = RequestProfiler(
+        directory=os.getenv('PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'object_chat_profiles')),
+        sample_rate=float(os.getenv('PROFILING_SAMPLE_RATE', '0.01')),
+        threshold_ms=float(os.getenv('PROFILING_THRESHOLD_MS', '1000')),
+        interval=float(os.getenv('PROFILING_INTERVAL_MS', '5')) / 1000.0,
+        max_profiles=int(os.getenv('PROFILING_MAX_PROFILES', '50')),
+        exclude_paths=('/ws/',)
+    )
+    request_profiler.init_app(app)
+
 # Initialize CSRF protection
 csrf = CSRFProtect(app)
 if os.getenv('PRODUCTION', 'False').lower() != 'true':
@@ -257,10 +386,25 @@ login_manager.login_view = 'login'
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+def admin_required(view):
+    """Restrict a view to the admin account created by deploy_prep.py"""
+    @wraps(view)
+    @login_required
+    def wrapped(*args, **kwargs):
+        if current_user.username != os.getenv('ADMIN_USERNAME', 'admin'):
+            return jsonify({"success": False, "error": "Admin access required"}), 403
+        return view(*args, **kwargs)
+    return wrapped
+
 # Create database tables (Flask 2.0+ way)
 with app.app_context():
     db.create_all()
     print("Database tables created")
+    # Until migrate_compression.py has run on PostgreSQL, keep writing plain text
+    print(f"Packed column writes: {configure_storage_format(db.engine)}")
+    # Until migrate_cascades.py has run, chat messages are deleted explicitly
+    CASCADING_DELETES = cascades_enabled(db.engine)
+    print(f"Database cascades chat deletes: {CASCADING_DELETES}")
 
 # Store conversation history for non-authenticated users
 conversation_history = []
@@ -316,90 +460,280 @@ object_personas = {
     }
 }
 
-def generate_object_persona(object_name):
-    """Generate a dynamic persona for an object if not predefined"""
-    if object_name.lower() in object_personas:
-        return object_personas[object_name.lower()]
+# Index over known persona names so near-matches reuse a cached persona
+persona_index = PersonaIndex(name for name in object_personas if name != "default")
+
+# Cache shared between workers for generated personas and conversation windows. Conversation
+# windows and rendered fragments change (possibly on another worker), so they are never kept per worker.
+cache = create_cache(shared_prefixes=("conversation:", "fragment:"))
+PERSONA_CACHE_TTL = int(os.getenv('PERSONA_CACHE_TTL', str(7 * 24 * 3600)))
+CONVERSATION_CACHE_TTL = int(os.getenv('CONVERSATION_CACHE_TTL', '3600'))
+CONVERSATION_WINDOW = 10
+
+def resolve_object_name(object_name):
+    """Name to chat under: the known object it is a typo of, if any, so the chat and its persona agree"""
+    name = normalize_object_name(object_name)
+    return persona_index.resolve(name) or name
+
+def find_cached_persona(object_name):
+    """Return a known persona for the object, tolerating plurals, articles and typos"""
+    name = normalize_object_name(object_name)
+    key = persona_index.resolve(name)
+    if key:
+        return object_personas[key]
     
-    # If we have Vertex AI initialized, try to generate a persona
-    if vertex_ai_initialized:
+    # Another worker (or an earlier run) may already have generated it
+    persona = cache.get(f"persona:{name}") if name else None
+    if persona:
+        object_personas[name] = persona
+        persona_index.add(name)
+    return persona
+
+def cache_persona(object_name, persona):
+    """Remember a generated persona so later lookups don't call the model again"""
+    key = normalize_object_name(object_name)
+    if key:
+        object_personas[key] = persona
+        persona_index.add(key)
+        cache.set(f"persona:{key}", persona, ttl=PERSONA_CACHE_TTL)
+
+def get_conversation_window(chat_session_id):
+    """Recent messages of a saved chat, from the cache or the database"""
+    window = cache.get(f"conversation:{chat_session_id}")
+    if window is None:
+        # Bring back messages that were moved to the archive while the chat was idle
+        restore_archived_messages(chat_session_id)
+        recent = ChatMessage.query.filter_by(chat_session_id=chat_session_id).order_by(ChatMessage.timestamp.desc()).limit(CONVERSATION_WINDOW).all()
+        window = [{"role": msg.role, "content": msg.content} for msg in reversed(recent)]
+    return window
+
+def restore_archived_messages(chat_session_id):
+    restored = rehydrate_session(chat_session_id)
+    if restored:
+        print(f"Restored {restored} archived messages for chat session {chat_session_id}")
+
+def store_conversation_window(chat_session_id, window):
+    """Cache the most recent messages of a saved chat for the next turn"""
+    cache.set(f"conversation:{chat_session_id}", window[-CONVERSATION_WINDOW:], ttl=CONVERSATION_CACHE_TTL)
+
+# Outcomes of persona replies: complete on the first call, repaired with a second call, or failed
+persona_output_stats = {"requests": 0, "complete": 0, "repairs": 0, "fields_repaired": 0,
+                        "repaired": 0, "failed": 0}
+
+def stream_persona_fields(prompt, fields, client_key=None, precharged=False):
+    """Stream a JSON persona reply, stopping as soon as the object is complete
+
+    Returns (valid fields, missing or invalid field names). Fields that were
+    complete before a reply was cut off are kept.
+    """
+    parser = JsonStreamParser()
+    chunks = stream_vertex_ai(prompt, temperature=0.8, max_output_tokens=500, top_p=0.9, client_key=client_key,
+                              precharged=precharged, task="persona", response_schema=persona_schema(fields))
+    try:
+        for chunk in chunks:
+            if parser.feed(chunk) is not None:
+                break
+    finally:
+        # Stops generation when the object closed early
+        chunks.close()
+    if not parser.done and parser.text:
+        print(f"Persona reply ended before its JSON object was complete: {parser.text[:150]}...")
+    return validate_persona(parser.salvage(), fields)
+
+def request_persona_from_model(object_name, client_key=None, precharged=False):
+    """Ask the model for a single persona; returns None if the call fails"""
+    print(f"Generating persona for {object_name} using Vertex AI")
+    persona_output_stats["requests"] += 1
+    persona, missing = stream_persona_fields(build_persona_prompt(object_name), PERSONA_FIELDS,
+                                             client_key=client_key, precharged=precharged)
+    if not missing:
+        persona_output_stats["complete"] += 1
+    elif persona:
+        # Ask again for only what is missing instead of regenerating the whole persona
+        print(f"Persona for {object_name} is missing {missing}; requesting only those fields")
+        persona_output_stats["repairs"] += 1
+        persona_output_stats["fields_repaired"] += len(missing)
+        # Part of the same job, so it is covered by the charge made when the job was scheduled
+        repaired, missing = stream_persona_fields(build_repair_prompt(object_name, persona, missing), missing,
+                                                  client_key=client_key, precharged=precharged)
+        persona.update(repaired)
+        if not missing:
+            persona_output_stats["repaired"] += 1
+    if missing:
+        print(f"Could not generate a valid persona for {object_name} (missing {missing})")
+        persona_output_stats["failed"] += 1
+        return None
+
+    print(f"Successfully generated persona for {object_name}")
+    persona = {field: persona[field] for field in PERSONA_FIELDS}
+    cache_persona(object_name, persona)
+    return persona
+
+def request_personas_from_model(object_names):
+    """Ask the model for several personas in one call; returns {name: persona}"""
+    print(f"Generating a batch of {len(object_names)} personas using Vertex AI: {object_names}")
+    response_text = query_vertex_ai(
+        build_batch_prompt(object_names),
+        temperature=0.8,
+        max_output_tokens=min(8192, 250 * len(object_names)),
+        top_p=0.9,
+        client_key=PERSONA_BATCH_CLIENT,
+        precharged=True,
+        task="persona",
+        response_schema=PERSONA_BATCH_SCHEMA
+    )
+    personas = parse_batch_response(response_text, object_names)
+    for name, persona in personas.items():
+        cache_persona(name, persona)
+    return personas
+
+# Batch concurrent persona requests into one model call (window of 0 disables batching)
+PERSONA_BATCH_CLIENT = "persona-batch"
+PERSONA_BATCH_WINDOW_MS = float(os.getenv('PERSONA_BATCH_WINDOW_MS', '50'))
+persona_batcher = None
+if PERSONA_BATCH_WINDOW_MS > 0:
+    persona_batcher = PersonaBatcher(
+        batch_fn=request_personas_from_model,
+        single_fn=lambda name: request_persona_from_model(name, client_key=PERSONA_BATCH_CLIENT, precharged=True),
+        window=PERSONA_BATCH_WINDOW_MS / 1000.0,
+        max_batch=int(os.getenv('PERSONA_BATCH_MAX', '4'))
+    )
+
+def build_object_persona(object_name):
+    """Generate a persona with the model; runs on the background persona worker"""
+    persona = find_cached_persona(object_name)
+    if persona:
+        return persona
+    if persona_batcher:
+        persona = persona_batcher.get(object_name)
+    else:
+        persona = request_persona_from_model(object_name, client_key=PERSONA_BATCH_CLIENT, precharged=True)
+    if persona:
+        cache_persona(object_name, persona)
+    return persona
+
+def store_chat_persona(chat_session_ids, persona):
+    """Save a generated persona to chats in the current session"""
+    # Keep updated_at so the upgrade doesn't reorder the user's chat list
+    db.session.execute(
+        update(ChatSession)
+        .where(ChatSession.id.in_(chat_session_ids))
+        .values(_persona=persona, updated_at=ChatSession.updated_at)
+    )
+    db.session.commit()
+
+def save_upgraded_persona(object_name, persona, chat_session_ids):
+    """Replace the fallback persona of chats that were started before generation finished"""
+    if not chat_session_ids:
+        return
+    with app.app_context():
+        store_chat_persona(chat_session_ids, persona)
+    print(f"Upgraded persona for {object_name} in chat sessions {chat_session_ids}")
+
+# Personas for new objects are generated off the request path
+persona_worker = PersonaWorker(build_object_persona, workers=int(os.getenv('PERSONA_WORKER_THREADS', '4')),
+                               retry_after=float(os.getenv('PERSONA_RETRY_AFTER', '60')))
+persona_worker.add_listener(save_upgraded_persona)
+
+def schedule_persona(object_name, chat_session_id=None, client_key=None):
+    """Start generating a persona in the background; returns False if that isn't possible"""
+    if not vertex_ai_initialized:
+        return False
+    if persona_worker.recently_failed(object_name):
+        # Don't charge the client and call the model again on every turn while generation keeps failing
+        return False
+    if not persona_worker.is_pending(object_name):
         try:
-            print(f"Generating persona for {object_name} using Vertex AI")
-            
-            # Create a prompt for generating a persona
-            prompt = f"""Create a persona for a {object_name} that will be used in a conversational AI application.
-            The persona should include:
-            1. A tone (e.g., friendly, formal, quirky, etc.)
-            2. A list of 3-5 personality traits
-            3. A brief introduction message (1-2 sentences) that the {object_name} would say to introduce itself
-            
-            Format your response exactly like this JSON structure:
-            {{"tone": "[tone]", "traits": ["trait1", "trait2", "trait3"], "introduction": "[introduction message]"}}
-            
-            Be creative and think about the physical properties, typical uses, and cultural associations of a {object_name}.
-            """
-            
-            # Query Vertex AI
-            response_text = query_vertex_ai(prompt, temperature=0.8, max_output_tokens=500, top_p=0.9)
-            
-            # Process the response
-            if response_text:
-                # Try to extract JSON from the response
-                try:
-                    # Find JSON pattern in the response
-                    json_match = re.search(r'\{[\s\S]*\}', response_text)
-                    if json_match:
-                        json_str = json_match.group(0)
-                        persona_data = json.loads(json_str)
-                        
-                        # Validate the required fields
-                        if all(k in persona_data for k in ["tone", "traits", "introduction"]):
-                            print(f"Successfully generated persona for {object_name}")
-                            return persona_data
-                except Exception as json_error:
-                    print(f"Error parsing JSON from response: {json_error}")
-                    
-                # Extract tone, traits, and introduction from the response
-                tone_match = re.search(r'Tone:?\s*([\s\S]+)', response_text)
-                tone = tone_match.group(1).strip() if tone_match else "friendly"
-                traits_match = re.search(r'Traits:?\s*([\s\S]+)', response_text)
-                traits = [t.strip() for t in traits_match.group(1).split(",")] if traits_match else ["helpful", "curious", "object-like", "unique"]
-                intro_match = re.search(r'[Ii]ntroduction:?\s*([\s\S]+)', response_text)
-                introduction = intro_match.group(1).strip() if intro_match else f"Hello! I am a {object_name}. How can I interact with you today?"
-                
-                # If no structured format was found, use the entire response as introduction
-                if not tone_match and not traits_match and not intro_match:
-                    introduction = response_text.strip()
-                
-                return {
-                    "tone": tone,
-                    "traits": traits,
-                    "introduction": introduction
-                }
-        except Exception as e:
-            print(f"Error generating persona with Vertex AI: {e}")
-            # Continue to fallback
-    
-    # Fallback persona with more creativity
-    print("Using fallback persona")
+            # Charge the requesting client now; the background call is precharged
+            admission.charge(client_key or current_client_key())
+        except AdmissionRejected as e:
+            print(f"{e}. Keeping fallback persona.")
+            return False
+    persona_worker.submit(object_name, chat_session_id)
+    return True
+
+def fallback_persona(object_name):
+    """Persona used until (or instead of) a generated one"""
     return {
         "tone": "friendly",
         "traits": ["helpful", "curious", "object-like", "unique"],
         "introduction": f"Hi there! I'm a {object_name}. It's quite an experience to be able to chat with you! What would you like to know about my life as a {object_name}?"
     }
 
-def generate_response(user_message, object_name):
-    """Generate a response based on the object's persona"""
-    global conversation_history
-    
-    print(f"\n=== GENERATING RESPONSE FOR: '{user_message}' AS '{object_name}' ===")
-    
-    # Get or create the object's persona
-    print(f"Getting persona for {object_name}")
-    persona = generate_object_persona(object_name)
-    print(f"Got persona with tone: {persona['tone']}, traits: {persona['traits']}")
+def is_fallback_persona(object_name, persona):
+    return not persona or persona == fallback_persona(object_name)
+
+def saved_chat_persona(chat_session, client_key=None):
+    """The chat's persona, upgrading a fallback whose background job was shed or lost"""
+    persona = chat_session.persona
+    if not is_fallback_persona(chat_session.object_name, persona):
+        return persona
+    generated = find_cached_persona(chat_session.object_name)
+    if generated:
+        store_chat_persona([chat_session.id], generated)
+        return generated
+    schedule_persona(chat_session.object_name, chat_session.id, client_key)
+    return persona or fallback_persona(chat_session.object_name)
+
+def generate_object_persona(object_name):
+    """Return the object's persona, or a fallback while one is generated in the background"""
+    persona = find_cached_persona(object_name)
+    if persona:
+        return persona
     
-    # Prepare the conversation context
+    schedule_persona(object_name)
+    print("Using fallback persona")
+    return fallback_persona(object_name)
+
+# Popular objects get their personas generated before anyone asks for them
+PREWARM_CLIENT = "prewarm"
+
+def prewarm_persona(object_name):
+    """Make sure the shared cache has a persona for the object; returns True if one is being generated"""
+    key = normalize_object_name(object_name)
+    if not key or cache.get(f"persona:{key}") is not None:
+        return False
+    persona = object_personas.get(key)
+    if persona:
+        # This worker already knows it; share it with the others again
+        cache.set(f"persona:{key}", persona, ttl=PERSONA_CACHE_TTL)
+        return False
+    return schedule_persona(key, client_key=PREWARM_CLIENT)
+
+prewarmer = None
+if os.getenv('PREWARM_ENABLED', 'False').lower() == 'true':
+    prewarmer = Prewarmer(
+        app,
+        prewarm_persona,
+        top_k=int(os.getenv('PREWARM_TOP_K', '20')),
+        days=int(os.getenv('POPULARITY_DAYS', '7')),
+        interval=float(os.getenv('PREWARM_INTERVAL', '300'))
+    )
+    app.before_request(prewarmer.start)
+
+# Suggestion buttons: objects related to the current one, then popular ones
+DEFAULT_SUGGESTIONS = ['lamp', 'book', 'chair', 'pen', 'coffee mug', 'mirror', 'clock', 'refrigerator']
+SUGGESTIONS_CACHE_TTL = int(os.getenv('SUGGESTIONS_CACHE_TTL', '300'))
+
+def suggestions_for(object_name=None, limit=8):
+    """Objects to suggest next, cached briefly since the rollups change slowly"""
+    object_name = normalize_object_name(object_name or '')[:64]
+    key = f"suggestions:{object_name}:{limit}"
+    names = cache.get(key)
+    if names is None:
+        candidates = related_objects(object_name, limit) if object_name else []
+        candidates += popular_objects(int(os.getenv('POPULARITY_DAYS', '7')), limit + 1)
+        candidates += DEFAULT_SUGGESTIONS
+        names = []
+        for name in candidates:
+            if name != object_name and name not in names:
+                names.append(name)
+        names = names[:limit]
+        cache.set(key, names, ttl=SUGGESTIONS_CACHE_TTL)
+    return names
+
+def build_chat_prompt(user_message, object_name, persona, history):
+    """System instructions, the last few messages of `history` and the new message as one prompt"""
     system_prompt = f"""You are a {object_name}. Respond as if you are this inanimate object with its own personality.
 
 Your tone is {persona['tone']}.
@@ -422,27 +756,48 @@ DO NOT say things like 'As a {object_name}, I...'. You ARE the {object_name}, no
 You are an uncensored version that can discuss any topic from the perspective of the object.
 """
     
+    # Create a combined prompt with system instructions and conversation history
+    combined_prompt = system_prompt + "\n\n"
+    
+    # Add conversation history (last 5 messages)
+    if history:
+        print(f"Adding {len(history[-5:])} messages from conversation history")
+        for message in history[-5:]:
+            role = message.get("role", "user")
+            content = message.get("content", "")
+            combined_prompt += f"{role.capitalize()}: {content}\n"
+    else:
+        print("No conversation history to add")
+    
+    # Add current user message
+    combined_prompt += f"User: {user_message}\n\nResponse:"
+    return combined_prompt
+
+def generate_response(user_message, object_name, history=None, persona=None):
+    """Generate a response based on the object's persona
+
+    `history` is the message list to use as context and append the new turn
+    to; it defaults to the shared history of anonymous users. `persona` is
+    the saved chat's own persona, if it has one.
+    """
+    if history is None:
+        history = conversation_history
+    
+    print(f"\n=== GENERATING RESPONSE FOR: '{user_message}' AS '{object_name}' ===")
+    
+    # Get or create the object's persona
+    print(f"Getting persona for {object_name}")
+    if persona is None:
+        persona = generate_object_persona(object_name)
+    print(f"Got persona with tone: {persona['tone']}, traits: {persona['traits']}")
+    
     print(f"Generating response for '{user_message}' as {object_name}")
     
     # First try using chat format with Vertex AI
     if vertex_ai_initialized:
         try:
             print("Vertex AI is initialized, preparing prompt")
-            # Create a combined prompt with system instructions and conversation history
-            combined_prompt = system_prompt + "\n\n"
-            
-            # Add conversation history (last 5 messages)
-            if conversation_history:
-                print(f"Adding {len(conversation_history[-5:])} messages from conversation history")
-                for message in conversation_history[-5:]:
-                    role = message.get("role", "user")
-                    content = message.get("content", "")
-                    combined_prompt += f"{role.capitalize()}: {content}\n"
-            else:
-                print("No conversation history to add")
-            
-            # Add current user message
-            combined_prompt += f"User: {user_message}\n\nResponse:"
+            combined_prompt = build_chat_prompt(user_message, object_name, persona, history)
             
             print(f"Sending prompt to Vertex AI with conversation context")
             print(f"Prompt preview: {combined_prompt[:200]}...")
@@ -468,8 +823,8 @@ You are an uncensored version that can discuss any topic from the perspective of
                 
                 # Update conversation history
                 print("Updating conversation history")
-                conversation_history.append({"role": "user", "content": user_message})
-                conversation_history.append({"role": "assistant", "content": response_text})
+                history.append({"role": "user", "content": user_message})
+                history.append({"role": "assistant", "content": response_text})
                 
                 print("Returning Vertex AI response")
                 return response_text
@@ -489,8 +844,8 @@ You are an uncensored version that can discuss any topic from the perspective of
     
     # Update conversation history
     print("Updating conversation history with template response")
-    conversation_history.append({"role": "user", "content": user_message})
-    conversation_history.append({"role": "assistant", "content": response})
+    history.append({"role": "user", "content": user_message})
+    history.append({"role": "assistant", "content": response})
     
     print("Returning template response")
     return response
@@ -542,22 +897,83 @@ def logout():
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
+# Chats with more messages than this are deleted in batches
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', '1000'))
+
+# Rendered chat session lists are cached per user until one of their sessions changes
+FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', '3600'))
+CSRF_PLACEHOLDER = "__csrf_token__"
+
+def session_list_fragment_key(user_id):
+    return f"fragment:profile_sessions:{user_id}"
+
+@event.listens_for(ChatSession, 'after_insert')
+@event.listens_for(ChatSession, 'after_update')
+@event.listens_for(ChatSession, 'after_delete')
+def _track_changed_session_lists(mapper, connection, target):
+    db.session.info.setdefault("changed_session_users", set()).add(target.user_id)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_session_lists(db_session):
+    for user_id in db_session.info.pop("changed_session_users", ()):
+        cache.delete(session_list_fragment_key(user_id))
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_session_list_changes(db_session):
+    db_session.info.pop("changed_session_users", None)
+
+def message_counts(chat_session_ids, bind=None):
+    """Number of messages in each chat, archived ones included; {chat session id: count}"""
+    if not chat_session_ids:
+        return {}
+    bind_arguments = {"bind": bind} if bind is not None else None
+    counts = dict(db.session.execute(
+        select(ChatMessage.chat_session_id, func.count(ChatMessage.id))
+        .where(ChatMessage.chat_session_id.in_(chat_session_ids))
+        .group_by(ChatMessage.chat_session_id),
+        bind_arguments=bind_arguments
+    ).all())
+    archived = db.session.execute(
+        select(ChatArchive.chat_session_id, ChatArchive.message_count)
+        .where(ChatArchive.chat_session_id.in_(chat_session_ids)),
+        bind_arguments=bind_arguments
+    )
+    for chat_session_id, count in archived:
+        counts[chat_session_id] = counts.get(chat_session_id, 0) + count
+    return counts
+
 @app.route('/profile')
 @login_required
 def profile():
-    # Get user's chat sessions
-    chat_sessions = ChatSession.query.filter_by(user_id=current_user.id).order_by(ChatSession.updated_at.desc()).all()
-    return render_template('profile.html', chat_sessions=chat_sessions)
+    key = session_list_fragment_key(current_user.id)
+    sessions_html = cache.get(key)
+    if sessions_html is None:
+        # Get user's chat sessions; from the primary, since a lagging replica's list would be cached for an hour
+        chat_sessions = db.session.execute(
+            select(ChatSession).filter_by(user_id=current_user.id).order_by(ChatSession.updated_at.desc()),
+            bind_arguments={"bind": db.engine}
+        ).scalars().all()
+        counts = message_counts([chat_session.id for chat_session in chat_sessions], bind=db.engine)
+        sessions_html = render_template('_chat_sessions.html', chat_sessions=chat_sessions, message_counts=counts,
+                                        csrf_placeholder=CSRF_PLACEHOLDER)
+        cache.set(key, sessions_html, ttl=FRAGMENT_CACHE_TTL)
+    
+    # CSRF tokens are per browser session, so they are never part of the cached HTML
+    sessions_html = Markup(sessions_html.replace(CSRF_PLACEHOLDER, generate_csrf()))
+    return render_template('profile.html', sessions_html=sessions_html)
 
 # Main routes
 @app.route('/')
 def index():
     # If user is logged in, get their recent chat sessions
     chat_sessions = None
+    counts = {}
     if current_user.is_authenticated:
         chat_sessions = ChatSession.query.filter_by(user_id=current_user.id).order_by(ChatSession.updated_at.desc()).limit(5).all()
+        counts = message_counts([chat_session.id for chat_session in chat_sessions])
     
-    return render_template('index.html', chat_sessions=chat_sessions)
+    return render_template('index.html', chat_sessions=chat_sessions, message_counts=counts, websocket_enabled=WEBSOCKET_ENABLED,
+                           suggestions=suggestions_for())
 
 @app.route('/chat', methods=['POST'])
 @csrf.exempt
@@ -576,11 +992,8 @@ def chat():
             current_object = active_session.object_name
     
     # Check if the user is trying to chat with a new object
-    if user_message.lower().startswith("chat with"):
-        # Extract the object name
-        object_name = user_message.lower().replace("chat with", "").strip()
-        object_name = object_name.replace("a ", "", 1).replace("an ", "", 1).strip()
-        
+    object_name = resolve_object_name(parse_chat_command(user_message))
+    if object_name:
         # Reset conversation for new object
         if current_object != object_name:
             # For authenticated users, create a new session if starting with a new object
@@ -591,8 +1004,11 @@ def chat():
             
             current_object = object_name
             
-            # Get the persona and return introduction
-            persona = generate_object_persona(object_name)
+            # Answer with a known persona, or a fallback while the model generates one
+            persona = find_cached_persona(object_name)
+            pending = persona is None
+            if pending:
+                persona = fallback_persona(object_name)
             
             # For authenticated users, store the persona
             if current_user.is_authenticated and not active_session:
@@ -615,6 +1031,10 @@ def chat():
                 db.session.add(first_message)
                 db.session.commit()
                 
+                # The generated persona replaces the fallback in this chat once it is ready
+                if pending:
+                    schedule_persona(object_name, new_session.id)
+                
                 # Return the session_id with the response
                 return jsonify({
                     "response": persona["introduction"],
@@ -622,6 +1042,8 @@ def chat():
                     "session_id": new_session.id
                 })
             
+            if pending:
+                schedule_persona(object_name)
             return jsonify({
                 "response": persona["introduction"],
                 "object": object_name
@@ -634,8 +1056,14 @@ def chat():
             "object": None
         })
     
+    # For authenticated users with an active session, use that chat's own history
+    history = None
+    if current_user.is_authenticated and active_session:
+        history = get_conversation_window(active_session.id)
+    
     # Generate response based on the current object
-    response = generate_response(user_message, current_object)
+    response = generate_response(user_message, current_object, history,
+                                 persona=saved_chat_persona(active_session) if active_session else None)
     
     # For authenticated users with an active session, save the messages
     if current_user.is_authenticated and active_session:
@@ -658,6 +1086,7 @@ def chat():
         # Update the session's last updated time
         active_session.updated_at = datetime.utcnow()
         db.session.commit()
+        store_conversation_window(active_session.id, history)
         
         return jsonify({
             "response": response,
@@ -670,6 +1099,203 @@ def chat():
         "object": current_object
     })
 
+# WebSocket chat transport: needs flask-sock and a server that can hold
+# connections open (e.g. gunicorn --threads), so it is opt-in
+WEBSOCKET_ENABLED = Sock is not None and os.getenv('WEBSOCKET_ENABLED', 'False').lower() == 'true'
+MAX_RESPONSE_CHARS = 500
+chat_connections = ConnectionRegistry()
+
+def push_persona_upgrade(object_name, persona, chat_session_ids):
+    """Hand a freshly generated persona to open connections still using the fallback"""
+    for connection in chat_connections.waiting_for(object_name):
+        connection.persona = persona
+        connection.persona_pending = False
+        try:
+            connection.send(type="persona", object=object_name, session_id=connection.chat_session_id, persona=persona)
+        except Exception as e:
+            print(f"Error pushing persona to a chat connection: {e}")
+
+persona_worker.add_listener(push_persona_upgrade)
+
+def is_same_origin():
+    """Browsers send Origin on WebSocket handshakes; refuse other sites riding the session cookie"""
+    origin = request.headers.get('Origin')
+    return origin is None or urlparse(origin).netloc == request.host
+
+def use_known_persona(connection, object_name, persona=None):
+    """Give the connection a persona for the object, falling back until one is generated"""
+    persona = persona or find_cached_persona(object_name)
+    connection.persona_pending = persona is None
+    connection.persona = persona or fallback_persona(object_name)
+
+def leave_chat_session(connection):
+    """Hand the resident conversation back to the cache for the HTTP endpoint and other workers"""
+    if connection.chat_session_id:
+        store_conversation_window(connection.chat_session_id, connection.history)
+
+def open_chat_session(connection, chat_session_id):
+    """Make one of the user's saved chats the connection's active chat"""
+    chat_session = ChatSession.query.filter_by(id=chat_session_id, user_id=connection.user_id).first()
+    if not chat_session:
+        return False
+    leave_chat_session(connection)
+    connection.chat_session_id = chat_session.id
+    connection.object_name = chat_session.object_name
+    saved = chat_session.persona
+    if is_fallback_persona(chat_session.object_name, saved):
+        # Its background job was shed or lost; use a generated persona if there is one by now
+        saved = None
+    use_known_persona(connection, chat_session.object_name, saved)
+    if not saved and not connection.persona_pending:
+        store_chat_persona([chat_session.id], connection.persona)
+    connection.history = get_conversation_window(chat_session.id)
+    if connection.persona_pending:
+        connection.persona_pending = schedule_persona(connection.object_name, chat_session.id, connection.client_key)
+    return True
+
+def start_object(connection, object_name):
+    """Switch the connection to a new object; returns the introduction"""
+    leave_chat_session(connection)
+    connection.chat_session_id = None
+    connection.object_name = object_name
+    use_known_persona(connection, object_name)
+    introduction = connection.persona["introduction"]
+    connection.history = [{"role": "assistant", "content": introduction}]
+    
+    if connection.user_id:
+        new_session = ChatSession(
+            user_id=connection.user_id,
+            object_name=object_name,
+            title=f"Chat with {object_name}",
+            persona=connection.persona
+        )
+        db.session.add(new_session)
+        db.session.flush()
+        connection.chat_session_id = new_session.id
+        db.session.add(ChatMessage(chat_session_id=new_session.id, role="assistant", content=introduction))
+        db.session.commit()
+    
+    if connection.persona_pending:
+        connection.persona_pending = schedule_persona(object_name, connection.chat_session_id, connection.client_key)
+    return introduction
+
+def stream_reply(connection, user_message):
+    """Send the model's reply to the client as it is generated; returns the full reply"""
+    prompt = build_chat_prompt(user_message, connection.object_name, connection.persona, connection.history)
+    parts = []
+    length = 0
+    for chunk in stream_vertex_ai(prompt, client_key=connection.client_key):
+        chunk = chunk[:MAX_RESPONSE_CHARS - length]
+        parts.append(chunk)
+        length += len(chunk)
+        connection.send(type="chunk", text=chunk)
+        if length >= MAX_RESPONSE_CHARS:
+            # Limit the response length to avoid very long outputs
+            parts.append("...")
+            connection.send(type="chunk", text="...")
+            break
+    
+    response = "".join(parts)
+    if not response.strip():
+        response = get_template_response(connection.object_name)
+    return response
+
+def save_turn(connection, user_message, response):
+    """Store both messages with a single multi-row insert, bump the chat's updated_at and refresh its cached window"""
+    now = datetime.utcnow()
+    db.session.execute(insert(ChatMessage), [
+        {"chat_session_id": connection.chat_session_id, "role": "user", "content": user_message, "timestamp": now},
+        # One microsecond later so the pair keeps its order when sorted by timestamp
+        {"chat_session_id": connection.chat_session_id, "role": "assistant", "content": response,
+         "timestamp": now + timedelta(microseconds=1)}
+    ])
+    # updated_at drives the chat list order and load_chat's ETag
+    db.session.execute(update(ChatSession).where(ChatSession.id == connection.chat_session_id).values(updated_at=now))
+    db.session.commit()
+    cache.delete(session_list_fragment_key(connection.user_id))
+    # /chat from another tab, or after the socket drops, must not see the window from before this turn
+    store_conversation_window(connection.chat_session_id, connection.history)
+
+def handle_chat_message(connection, data):
+    """The WebSocket counterpart of /chat, using the connection's resident state"""
+    user_message = str(data.get('message', '')).strip()
+    if not user_message:
+        return
+    
+    try:
+        session_id = int(data.get('session_id') or 0)
+    except (TypeError, ValueError):
+        session_id = 0
+    if connection.user_id and session_id and session_id != connection.chat_session_id:
+        open_chat_session(connection, session_id)
+    
+    object_name = resolve_object_name(parse_chat_command(user_message))
+    if object_name and object_name != connection.object_name:
+        introduction = start_object(connection, object_name)
+        connection.send(type="done", response=introduction, object=object_name, session_id=connection.chat_session_id)
+        return
+    
+    if not connection.object_name:
+        connection.send(type="done", object=None,
+                        response="Please specify an object to chat with by saying 'Chat with [object name]'")
+        return
+    
+    response = stream_reply(connection, user_message)
+    connection.history.append({"role": "user", "content": user_message})
+    connection.history.append({"role": "assistant", "content": response})
+    connection.history = connection.history[-CONVERSATION_WINDOW:]
+    if connection.chat_session_id:
+        save_turn(connection, user_message, response)
+    connection.send(type="done", response=response, object=connection.object_name, session_id=connection.chat_session_id)
+
+if WEBSOCKET_ENABLED:
+    sock = Sock(app)
+    
+    @sock.route('/ws/chat')
+    def ws_chat(ws):
+        if not is_same_origin():
+            ws.close(reason=1008, message="Cross-origin connection refused")
+            return
+        
+        # Authenticate once; later messages reuse the connection's state
+        connection = ChatConnection(
+            ws,
+            current_user.id if current_user.is_authenticated else None,
+            current_client_key()
+        )
+        db.session.remove()  # don't hold a pooled connection while the socket is idle
+        chat_connections.add(connection)
+        try:
+            while True:
+                raw = ws.receive()
+                try:
+                    data = json.loads(raw)
+                except (TypeError, ValueError):
+                    connection.send(type="error", error="Invalid message")
+                    continue
+                try:
+                    handle_chat_message(connection, data)
+                except ConnectionClosed:
+                    raise
+                except Exception as e:
+                    print(f"Error handling WebSocket chat message: {e}")
+                    db.session.rollback()
+                    connection.send(type="error", error="Sorry, there was an error processing your request.")
+                finally:
+                    db.session.remove()
+        finally:
+            chat_connections.remove(connection)
+            leave_chat_session(connection)
+
+@app.route('/suggestions', methods=['GET'])
+def suggestions():
+    """Objects to offer as suggestion buttons, related to ?object= when given"""
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    return jsonify({
+        "object": request.args.get('object'),
+        "suggestions": suggestions_for(request.args.get('object'), limit)
+    })
+
 @app.route('/save_chat', methods=['POST'])
 @login_required
 def save_chat():
@@ -713,6 +1339,7 @@ def save_chat():
         # Update the session's last updated time
         chat_session.updated_at = datetime.utcnow()
         db.session.commit()
+        cache.delete(f"conversation:{chat_session.id}")
         
         return jsonify({"success": True, "session_id": chat_session.id})
     
@@ -728,6 +1355,15 @@ def load_chat(session_id):
     if not chat_session:
         return jsonify({"success": False, "error": "Chat session not found"})
     
+    # Restore archived messages even when the browser's copy is current, since
+    # the next turn reads the conversation from the hot table
+    restore_archived_messages(session_id)
+    
+    # Answer 304 when the browser already has this version of the conversation
+    etag, last_modified = chat_validators(chat_session)
+    if is_not_modified(etag, last_modified):
+        return set_validators(make_response('', 304), etag, last_modified)
+    
     # Get all messages in this session
     messages = ChatMessage.query.filter_by(chat_session_id=session_id).order_by(ChatMessage.timestamp).all()
     
@@ -737,11 +1373,46 @@ def load_chat(session_id):
         "content": msg.content
     } for msg in messages]
     
-    return jsonify({
+    response = jsonify({
         "success": True,
         "object_name": chat_session.object_name,
         "messages": message_list
     })
+    return set_validators(response, etag, last_modified)
+
+@app.route('/export', methods=['GET'])
+@login_required
+def export_chats():
+    """Stream all of the user's chats as NDJSON; ?gzip=1 compresses, ?cursor= resumes"""
+    cursor = request.args.get('cursor')
+    try:
+        parse_cursor(cursor)
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid cursor"}), 400
+    
+    compress = request.args.get('gzip', 'false').lower() in ('1', 'true')
+    chunks = ndjson_chunks(export_records(current_user.id, cursor))
+    filename = f"chats-{current_user.username}.ndjson"
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+    response = Response(stream_with_context(chunks),
+                        mimetype='application/gzip' if compress else 'application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.cache_control.no_store = True
+    return response
+
+@app.route('/import', methods=['POST'])
+@login_required
+def import_chats():
+    """Add chats from an NDJSON export (optionally gzipped) sent as the request body"""
+    chunks = iter(lambda: request.stream.read(CHUNK_SIZE), b"")
+    try:
+        report = import_records(current_user.id, read_records(chunks))
+    except (ValueError, KeyError, zlib.error) as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": f"Invalid export file: {e}"}), 400
+    return jsonify(dict(report, success=True))
 
 @app.route('/delete_chat/<int:session_id>', methods=['POST'])
 @login_required
@@ -752,23 +1423,149 @@ def delete_chat(session_id):
         flash("Chat session not found", "danger")
         return redirect(url_for('profile'))
     
-    # Delete the chat session (cascade will delete messages)
-    db.session.delete(chat_session)
-    db.session.commit()
+    if count_messages(session_id) > PURGE_BATCH_SIZE:
+        # Very long chats are deleted in batches so no single transaction holds locks for long
+        purge_chat_session(session_id, batch_size=PURGE_BATCH_SIZE)
+        cache.delete(session_list_fragment_key(current_user.id))
+    else:
+        # Delete the chat session (the database cascades the delete to its messages)
+        if not CASCADING_DELETES:
+            db.session.execute(delete(ChatMessage).where(ChatMessage.chat_session_id == session_id),
+                               execution_options={"synchronize_session": False})
+        db.session.delete(chat_session)
+        db.session.commit()
+    cache.delete(f"conversation:{session_id}")
     
     flash("Chat session deleted successfully", "success")
     return redirect(url_for('profile'))
 
 # Health check endpoint for deployment monitoring
+def database_pool_stats():
+    """Pool stats for the primary database and the replica, if configured"""
+    stats = {"primary": pool_stats(db.engine)}
+    if REPLICA_BIND in db.engines:
+        stats["replica"] = pool_stats(db.engines[REPLICA_BIND])
+    return stats
+
+# Dependency checks run by a background thread; the probe endpoints only read its cached results
+HEALTH_DB_LATENCY_MS = float(os.getenv('HEALTH_DB_LATENCY_MS', '1000'))
+HEALTH_MAX_POOL_SATURATION = float(os.getenv('HEALTH_MAX_POOL_SATURATION', '0.95'))
+HEALTH_MAX_QUEUE_FRACTION = float(os.getenv('HEALTH_MAX_QUEUE_FRACTION', '0.8'))
+
+def check_database(engine):
+    """Round trip to the database, including the wait for a pooled connection"""
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    latency_ms = 1000 * (time.perf_counter() - started)
+    return {"ok": latency_ms <= HEALTH_DB_LATENCY_MS, "latency_ms": round(latency_ms, 2)}
+
+def check_pool():
+    saturation = {name: stats.get("saturation") for name, stats in database_pool_stats().items()}
+    return {
+        "ok": all(value is None or value <= HEALTH_MAX_POOL_SATURATION for value in saturation.values()),
+        "saturation": saturation
+    }
+
+def check_model():
+    """Whether the model backend answers, without generating anything"""
+    degraded = {tier: health["degraded"] for tier, health in model_router.snapshot()["models"].items() if health["degraded"]}
+    if not vertex_ai_initialized:
+        return {"ok": False, "backend": "none"}
+    if stub_models is not None:
+        return {"ok": True, "backend": "stub", "degraded": degraded}
+    started = time.perf_counter()
+    GenerativeModel(MODEL_ID).count_tokens("ping")
+    return {"ok": True, "backend": "vertex", "latency_ms": round(1000 * (time.perf_counter() - started), 2),
+            "degraded": degraded}
+
+def check_queues():
+    stats = admission.stats()
+    return {
+        "ok": stats["waiting"] < HEALTH_MAX_QUEUE_FRACTION * admission.max_queue,
+        "model_calls_active": stats["active"],
+        "model_calls_waiting": stats["waiting"],
+        "personas_pending": persona_worker.snapshot()["pending"]
+    }
+
+health_prober = HealthProber(app, interval=float(os.getenv('HEALTH_PROBE_INTERVAL', '10')))
+health_prober.add_check("database", lambda: check_database(db.engine))
+if REPLICA_BIND in app.config.get('SQLALCHEMY_BINDS', {}):
+    health_prober.add_check("database_replica", lambda: check_database(db.engines[REPLICA_BIND]))
+health_prober.add_check("db_pool", check_pool)
+health_prober.add_check("queues", check_queues)
+# Template responses cover a model outage, so it doesn't take the worker out of rotation
+health_prober.add_check("model", check_model, critical=False, every=float(os.getenv('HEALTH_MODEL_INTERVAL', '60')),
+                        timeout=float(os.getenv('HEALTH_MODEL_TIMEOUT', '10')))
+
+@app.route('/livez')
+def livez():
+    """Liveness: the worker answers requests and its health checks are still running"""
+    health_prober.start()
+    if not health_prober.is_alive():
+        return jsonify({"status": "dead", "reason": "health prober stopped"}), 503
+    return jsonify({"status": "alive", "uptime_s": round(time.time() - health_prober.started_at, 1)})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: whether the load balancer should send this worker traffic"""
+    health_prober.start()
+    snapshot = health_prober.snapshot()
+    body = {
+        "status": "ready" if snapshot["ready"] else "not ready",
+        "reason": snapshot["reason"],
+        "age_s": snapshot["age_s"],
+        "checks": {name: result["ok"] for name, result in snapshot["checks"].items()}
+    }
+    return jsonify(body), 200 if snapshot["ready"] else 503
+
 @app.route('/health')
 def health():
+    health_prober.start()
+    snapshot = health_prober.snapshot()
+    model = snapshot["checks"].get("model", {})
     return jsonify({
-        "status": "healthy",
+        "status": "healthy" if snapshot["ready"] else ("starting" if snapshot["reason"] == "starting" else "unhealthy"),
+        "reason": snapshot["reason"],
         "version": "1.0.0",
-        "database": "connected" if db.engine.pool.checkedout() >= 0 else "error",
-        "vertex_ai": "initialized" if vertex_ai_initialized else "not initialized"
+        "age_s": snapshot["age_s"],
+        "checks": snapshot["checks"],
+        "database": database_pool_stats(),
+        "vertex_ai": "reachable" if model.get("ok") else ("initialized" if vertex_ai_initialized else "not initialized")
     })
 
+# Counters for capacity planning and alerting
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        "admission": admission.stats(),
+        "db_pool": database_pool_stats(),
+        "persona_index": dict(persona_index.stats, size=len(persona_index)),
+        "persona_batcher": persona_batcher.stats if persona_batcher else None,
+        "persona_worker": persona_worker.snapshot(),
+        "websocket_connections": len(chat_connections),
+        "prewarmer": prewarmer.stats if prewarmer else None,
+        "model_router": model_router.snapshot(),
+        "persona_output": persona_output_stats,
+        "cache": cache.stats
+    })
+
+# Stored request profiles, as collapsed stacks for flame graph tools
+@app.route('/admin/profiles')
+@admin_required
+def list_profiles():
+    if not request_profiler:
+        return jsonify({"success": False, "error": "Profiling is not enabled (set PROFILING_ENABLED=true)"}), 404
+    return jsonify({"success": True, "profiles": request_profiler.list_profiles()})
+
+@app.route('/admin/profiles/<profile_id>')
+@admin_required
+def get_profile(profile_id):
+    profile = request_profiler.load_profile(profile_id) if request_profiler else None
+    if profile is None:
+        return jsonify({"success": False, "error": "Profile not found"}), 404
+    return app.response_class(collapsed_stacks(profile), mimetype='text/plain')
+
 if __name__ == '__main__':
     # Only use debug mode in development
     debug_mode = os.getenv('PRODUCTION', 'False').lower() != 'true'
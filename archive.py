@@ -0,0 +1,164 @@
+import json
+import zlib
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, insert, exists, text
+from models import db, ChatSession, ChatMessage, ChatArchive
+
+def _encode(messages):
+    return zlib.compress(json.dumps(messages, separators=(",", ":")).encode("utf-8"), 9)
+
+def _decode(data):
+    return json.loads(zlib.decompress(data))
+
+def decode_archived_messages(data):
+    """Messages from a ChatArchive.data blob, oldest first"""
+    return [{
+        "id": msg["id"],
+        "role": msg["role"],
+        "content": msg["content"],
+        "timestamp": datetime.fromisoformat(msg["timestamp"]) if msg["timestamp"] else None
+    } for msg in _decode(data)]
+
+def archived_messages(chat_session_id, archive=None):
+    """Messages stored in a session's archive, oldest first (empty if not archived)"""
+    archive = archive or db.session.get(ChatArchive, chat_session_id)
+    if archive is None:
+        return []
+    return decode_archived_messages(archive.data)
+
+def archive_session(chat_session_id):
+    """Move a session's messages from the hot table into its compressed archive
+
+    Messages added after an earlier archive run are merged into the existing
+    archive. Returns (messages moved, raw bytes, compressed bytes).
+    """
+    rows = db.session.execute(
+        select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.timestamp)
+        .where(ChatMessage.chat_session_id == chat_session_id)
+        .order_by(ChatMessage.timestamp, ChatMessage.id)
+    ).all()
+    if not rows:
+        return 0, 0, 0
+
+    archive = db.session.get(ChatArchive, chat_session_id)
+    messages = _decode(archive.data) if archive else []
+    messages.extend({
+        "id": row.id,
+        "role": row.role,
+        "content": row.content,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None
+    } for row in rows)
+
+    data = _encode(messages)
+    raw_size = sum(len(msg["content"].encode("utf-8")) for msg in messages)
+    if archive is None:
+        archive = ChatArchive(chat_session_id=chat_session_id)
+        db.session.add(archive)
+    archive.message_count = len(messages)
+    archive.raw_size = raw_size
+    archive.data = data
+    archive.archived_at = datetime.utcnow()
+
+    # Delete by id so a message written while we were archiving stays in the hot table
+    ids = [row.id for row in rows]
+    for start in range(0, len(ids), 1000):
+        db.session.execute(delete(ChatMessage).where(ChatMessage.id.in_(ids[start:start + 1000])),
+                           execution_options={"synchronize_session": False})
+    db.session.commit()
+    return len(rows), sum(len((row.content or "").encode("utf-8")) for row in rows), len(data)
+
+def rehydrate_session(chat_session_id):
+    """Move an archived session's messages back into the hot table
+
+    Returns the number of messages restored (0 if the session wasn't archived,
+    or another request restored it first).
+    """
+    # Most chats were never archived; only those pay for the locking read on the primary
+    if not db.session.execute(select(exists().where(ChatArchive.chat_session_id == chat_session_id))).scalar():
+        return 0
+    # Lock the archive row so concurrent loads of the same chat restore it once
+    archive = db.session.execute(
+        select(ChatArchive).where(ChatArchive.chat_session_id == chat_session_id).with_for_update()
+    ).scalar()
+    if archive is None:
+        return 0
+    db.session.expunge(archive)
+    # Claim the archive by deleting it; where FOR UPDATE isn't supported (SQLite) a
+    # concurrent restore that committed first leaves nothing to delete
+    claimed = db.session.execute(
+        delete(ChatArchive).where(ChatArchive.chat_session_id == chat_session_id),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if claimed != 1:
+        return 0
+    messages = archived_messages(chat_session_id, archive)
+    db.session.execute(insert(ChatMessage), [dict(msg, chat_session_id=chat_session_id) for msg in messages])
+    db.session.commit()
+    return len(messages)
+
+def archive_idle_sessions(idle_days, batch_size=100, limit=None):
+    """Archive every session not updated for `idle_days` days that still has hot messages"""
+    cutoff = datetime.utcnow() - timedelta(days=idle_days)
+    has_hot_messages = exists().where(ChatMessage.chat_session_id == ChatSession.id)
+    report = {"sessions": 0, "messages": 0, "raw_bytes": 0, "compressed_bytes": 0}
+    last_id = 0
+    while limit is None or report["sessions"] < limit:
+        session_ids = db.session.execute(
+            select(ChatSession.id)
+            .where(ChatSession.updated_at < cutoff, ChatSession.id > last_id, has_hot_messages)
+            .order_by(ChatSession.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not session_ids:
+            break
+        for chat_session_id in session_ids:
+            moved, raw_bytes, compressed_bytes = archive_session(chat_session_id)
+            report["sessions"] += 1
+            report["messages"] += moved
+            report["raw_bytes"] += raw_bytes
+            report["compressed_bytes"] += compressed_bytes
+            if limit is not None and report["sessions"] >= limit:
+                break
+        last_id = session_ids[-1]
+    return report
+
+def hot_table_size():
+    """On-disk size of the chat_message table in bytes, where the database can tell us"""
+    if db.engine.dialect.name == "postgresql":
+        return db.session.execute(text("SELECT pg_total_relation_size('chat_message')")).scalar()
+    return None
+
+def vacuum_hot_table():
+    """Return the space freed by archiving to the database"""
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if db.engine.dialect.name == "postgresql":
+            conn.execute(text("VACUUM (ANALYZE) chat_message"))
+        elif db.engine.dialect.name == "sqlite":
+            conn.execute(text("VACUUM"))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move messages of idle chat sessions into compressed archives")
+    parser.add_argument("--days", type=int, default=365, help="archive sessions idle for more than this many days")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--limit", type=int, help="archive at most this many sessions")
+    parser.add_argument("--vacuum", action="store_true", help="vacuum the message table afterwards")
+    parser.add_argument("--restore", type=int, metavar="SESSION_ID", help="move one session back to the hot table")
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.restore:
+            print(f"Restored {rehydrate_session(args.restore)} messages to chat session {args.restore}")
+        else:
+            size_before = hot_table_size()
+            report = archive_idle_sessions(args.days, args.batch_size, args.limit)
+            saved = report["raw_bytes"] - report["compressed_bytes"]
+            print(f"Archived {report['messages']} messages from {report['sessions']} sessions: "
+                  f"{report['raw_bytes']} bytes of content stored in {report['compressed_bytes']} bytes "
+                  f"({saved} bytes saved)")
+            if args.vacuum:
+                vacuum_hot_table()
+                size_after = hot_table_size()
+                if size_before is not None and size_after is not None:
+                    print(f"chat_message table: {size_before} -> {size_after} bytes ({size_before - size_after} reclaimed)")
@@ -0,0 +1,251 @@
+"""End-to-end load and latency benchmark for the chat pipeline.
+
+Runs the Flask app in-process against a freshly seeded database and the local
+stub model, drives realistic scenarios from several threads and reports
+throughput and p50/p95/p99 latency per endpoint.
+
+Usage:
+    python benchmarks/load_test.py                        # compare against benchmarks/baseline.json
+    python benchmarks/load_test.py --update-baseline      # record a new baseline
+    python benchmarks/load_test.py --database-url postgresql://...  # use PostgreSQL (tables are created, not dropped)
+
+Exits with status 1 when any endpoint regresses by more than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.common import percentile
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+NOVEL_OBJECTS = [
+    "toaster", "umbrella", "stapler", "teapot", "bicycle", "candle", "sock", "guitar",
+    "kettle", "backpack", "telescope", "hammock", "pillow", "skateboard", "violin", "spoon"
+]
+
+USER_MESSAGES = [
+    "How are you today?",
+    "What's the hardest part of your job?",
+    "Tell me a secret about the people who use you.",
+    "What do you think about when nobody is around?",
+    "If you could change one thing about yourself, what would it be?"
+]
+
+def configure_environment(args, workdir):
+    """Point the app at a scratch database, the stub model and in-process caches"""
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["MODEL_BACKEND"] = "stub"
+    os.environ["STUB_MODEL_LATENCY"] = str(args.model_latency)
+    os.environ["CACHE_BACKEND"] = "memory"
+    # The benchmark measures the pipeline, not the rate limiter
+    os.environ["LLM_USER_RATE"] = os.environ["LLM_USER_BURST"] = "100000"
+    os.environ["LLM_GLOBAL_RATE"] = os.environ["LLM_GLOBAL_BURST"] = "100000"
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.concurrency)
+    os.environ["PRODUCTION"] = "False"
+
+def seed_database(app, db, User, ChatSession, ChatMessage, users, sessions_per_user, messages_per_session):
+    """Create users with saved chats; returns {username: [session ids]}"""
+    seeded = {}
+    with app.app_context():
+        for u in range(users):
+            user = User(username=f"bench{u}", email=f"bench{u}@example.com")
+            user.set_password("benchmark-password")
+            db.session.add(user)
+            db.session.flush()
+            seeded[user.username] = []
+            for s in range(sessions_per_user):
+                chat_session = ChatSession(user_id=user.id, object_name=random.choice(NOVEL_OBJECTS),
+                                           title=f"Benchmark chat {s}")
+                db.session.add(chat_session)
+                db.session.flush()
+                seeded[user.username].append(chat_session.id)
+                db.session.add_all([
+                    ChatMessage(chat_session_id=chat_session.id,
+                                role="user" if m % 2 == 0 else "assistant",
+                                content=f"Message {m}: " + random.choice(USER_MESSAGES) * 3)
+                    for m in range(messages_per_session)
+                ])
+            db.session.commit()
+    return seeded
+
+class Recorder:
+    """Collects per-endpoint latencies and errors from many threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+def succeeded(response):
+    """Endpoints like /save_chat report failures as 200 with {"success": false}"""
+    if response.status_code >= 400:
+        return False
+    data = response.get_json(silent=True) if response.is_json else None
+    return not isinstance(data, dict) or data.get("success", True) is not False
+
+def timed(recorder, endpoint, call):
+    started = time.perf_counter()
+    response = call()
+    recorder.record(endpoint, time.perf_counter() - started, succeeded(response))
+    return response
+
+def make_scenarios(seeded, args):
+    """Each scenario is (endpoint name, function(client, username, rng) -> None)"""
+    def new_object_chat(client, username, rng):
+        obj = f"{rng.choice(NOVEL_OBJECTS)} {rng.randrange(10 ** 6)}"
+        return client.post("/chat", json={"message": f"Chat with a {obj}"})
+
+    def long_conversation(client, username, rng):
+        session_id = rng.choice(seeded[username])
+        return client.post("/chat", json={"message": rng.choice(USER_MESSAGES), "session_id": session_id})
+
+    def bulk_save(client, username, rng):
+        messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": rng.choice(USER_MESSAGES)}
+                    for i in range(args.save_messages)]
+        return client.post("/save_chat", json={"object_name": rng.choice(NOVEL_OBJECTS), "messages": messages})
+
+    def history_reload(client, username, rng):
+        return client.get(f"/load_chat/{rng.choice(seeded[username])}")
+
+    def profile(client, username, rng):
+        return client.get("/profile")
+
+    return [
+        ("POST /chat (new object)", new_object_chat),
+        ("POST /chat (long conversation)", long_conversation),
+        ("POST /save_chat", bulk_save),
+        ("GET /load_chat", history_reload),
+        ("GET /profile", profile)
+    ]
+
+def run_scenario(app, usernames, endpoint, action, args, recorder):
+    """Run one scenario from `args.concurrency` logged-in clients; returns wall time"""
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        username = usernames[index % len(usernames)]
+        client = app.test_client()
+        client.post("/login", data={"username": username, "password": "benchmark-password"})
+        for _ in range(args.requests // args.concurrency):
+            timed(recorder, endpoint, lambda: action(client, username, rng))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+def summarize(recorder, wall_times):
+    results = {}
+    for endpoint, latencies in recorder.latencies.items():
+        results[endpoint] = {
+            "requests": len(latencies),
+            "errors": recorder.errors.get(endpoint, 0),
+            "throughput_rps": round(len(latencies) / wall_times[endpoint], 2),
+            "p50_ms": round(1000 * percentile(latencies, 50), 2),
+            "p95_ms": round(1000 * percentile(latencies, 95), 2),
+            "p99_ms": round(1000 * percentile(latencies, 99), 2)
+        }
+    return results
+
+def compare(results, baseline, threshold):
+    """Return a list of human-readable regressions beyond `threshold` (a fraction)"""
+    regressions = []
+    for endpoint, current in results.items():
+        previous = baseline.get(endpoint)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if previous[metric] > 0 and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{endpoint}: {metric} {previous[metric]} -> {current[metric]}")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{endpoint}: throughput_rps {previous['throughput_rps']} -> {current['throughput_rps']}")
+        if current["errors"] > previous.get("errors", 0):
+            regressions.append(f"{endpoint}: errors {previous.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite database")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--sessions-per-user", type=int, default=5)
+    parser.add_argument("--messages-per-session", type=int, default=200)
+    parser.add_argument("--save-messages", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model-latency", type=float, default=0.02, help="stub model seconds per call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed regression, e.g. 0.25 = 25%%")
+    parser.add_argument("--output", help="also write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own logging")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="object-chat-bench-")
+    configure_environment(args, workdir)
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+
+    with quiet:
+        from app import app, db
+        from models import User, ChatSession, ChatMessage
+        app.config["WTF_CSRF_ENABLED"] = False
+        seeded = seed_database(app, db, User, ChatSession, ChatMessage,
+                               args.users, args.sessions_per_user, args.messages_per_session)
+
+        recorder = Recorder()
+        wall_times = {}
+        for endpoint, action in make_scenarios(seeded, args):
+            wall_times[endpoint] = run_scenario(app, list(seeded), endpoint, action, args, recorder)
+
+    results = summarize(recorder, wall_times)
+    print(f"{'endpoint':<32} {'reqs':>5} {'err':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, r in results.items():
+        print(f"{endpoint:<32} {r['requests']:>5} {r['errors']:>4} {r['throughput_rps']:>8} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    if regressions:
+        print(f"Regressions beyond {100 * args.threshold:.0f}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("No regressions against baseline")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Compare model routing policies offline against stub models.
+
+A mix of short chat turns, long-context chat turns and persona requests is
+sent through three policies: the fast model only, the large model only, and
+the router with both. Partway through the run the fast model degrades
+(slower and failing half its calls) and then recovers.
+
+Usage: python benchmarks/model_routing.py [--calls 600] [--concurrency 8] [--latency 0.02]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile
+from model_router import ModelRouter
+from stub_model import StubModel
+
+def make_workload(calls, rng):
+    """(task, prompt) pairs: mostly short chat turns, some long ones and some personas"""
+    workload = []
+    for i in range(calls):
+        roll = rng.random()
+        if roll < 0.1:
+            workload.append(("persona", f"Create a persona for a teapot {i} that will be used in a conversational AI application."))
+        elif roll < 0.2:
+            workload.append(("chat", "You are a teapot. " + "User: tell me more about your day.\n" * 150))
+        else:
+            workload.append(("chat", f"You are a teapot. User: how are you today? ({i})"))
+    return workload
+
+def run_policy(name, models, workload, args):
+    stubs = {
+        "fast": StubModel(latency=args.latency, per_token_latency=0.0005, seed=1),
+        "large": StubModel(latency=3 * args.latency, per_token_latency=0.001, seed=2)
+    }
+    router = ModelRouter(
+        {tier: tier for tier in models},
+        call_fn=lambda model, prompt, max_output_tokens=150: stubs[model].generate(prompt, max_output_tokens),
+        latency_slo={"fast": 4 * args.latency, "large": 10 * args.latency},
+        health_window=2.0,
+        cooldown=0.5
+    )
+    degrade_from, degrade_to = int(0.3 * len(workload)), int(0.6 * len(workload))
+    latencies = []
+    failures = 0
+
+    def call(index):
+        nonlocal failures
+        # The fast model has a bad patch in the middle of the run
+        degraded = degrade_from <= index < degrade_to
+        stubs["fast"].failure_rate = 0.5 if degraded else 0.0
+        stubs["fast"].latency = args.latency * (5 if degraded else 1)
+        task, prompt = workload[index]
+        started = time.perf_counter()
+        text = router.generate(task, prompt, max_output_tokens=500 if task == "persona" else 150)
+        latencies.append(time.perf_counter() - started)
+        if not text:
+            failures += 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(call, range(len(workload))))
+
+    stats = router.snapshot()
+    calls = {tier: stubs[tier].calls for tier in models}
+    print(f"{name:<11} ok={100.0 * (1 - failures / len(workload)):5.1f}% "
+          f"p50={1000 * percentile(latencies, 50):7.1f}ms p95={1000 * percentile(latencies, 95):7.1f}ms "
+          f"p99={1000 * percentile(latencies, 99):7.1f}ms calls={calls} escalations={stats['escalations']}")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="fast stub fixed cost per call (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true", help="print routing decisions")
+    args = parser.parse_args()
+
+    workload = make_workload(args.calls, random.Random(args.seed))
+    for name, models in (("fast only", ["fast"]), ("large only", ["large"]), ("routed", ["fast", "large"])):
+        stats = run_policy(name, models, workload, args)
+        if args.verbose:
+            for decision, count in sorted(stats["decisions"].items()):
+                print(f"    {decision}: {count}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Compare per-object persona calls with micro-batched calls against the stub model.
+
+Usage: python benchmarks/persona_batching.py [--requests 64] [--rate 40] [--window-ms 50]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile
+from persona_batcher import PersonaBatcher, build_batch_prompt, parse_batch_response
+from stub_model import StubModel
+
+OBJECTS = [
+    "toaster", "umbrella", "stapler", "teapot", "bicycle", "candle", "sock", "guitar",
+    "kettle", "backpack", "telescope", "hammock", "pillow", "skateboard", "violin", "spoon",
+    "cactus", "bucket", "ladder", "doorbell", "scarf", "compass", "helmet", "anchor"
+]
+
+def single_prompt(object_name):
+    return f"Create a persona for a {object_name} that will be used in a conversational AI application."
+
+def run(requests, rate, call):
+    """Fire `requests` calls at roughly `rate` per second and time each one"""
+    latencies = []
+    lock = threading.Lock()
+    rng = random.Random(7)
+
+    def worker(object_name):
+        started = time.perf_counter()
+        call(object_name)
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    threads = []
+    for i in range(requests):
+        thread = threading.Thread(target=worker, args=(f"{OBJECTS[i % len(OBJECTS)]} {i}",))
+        thread.start()
+        threads.append(thread)
+        time.sleep(rng.expovariate(rate))
+    for thread in threads:
+        thread.join()
+    return latencies
+
+def report(name, latencies, model):
+    print(f"{name:<10} calls={model.calls:<4} output_tokens={model.output_tokens:<6} "
+          f"p50={1000 * percentile(latencies, 50):7.1f}ms p95={1000 * percentile(latencies, 95):7.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--rate", type=float, default=40.0, help="arrivals per second")
+    parser.add_argument("--window-ms", type=float, default=50.0)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub fixed cost per call (s)")
+    args = parser.parse_args()
+
+    unbatched_model = StubModel(latency=args.latency, seed=1)
+    unbatched = run(args.requests, args.rate, lambda name: unbatched_model.generate(single_prompt(name), 500))
+
+    batched_model = StubModel(latency=args.latency, seed=1)
+    batcher = PersonaBatcher(
+        batch_fn=lambda names: parse_batch_response(
+            batched_model.generate(build_batch_prompt(names), 250 * len(names)), names),
+        single_fn=lambda name: batched_model.generate(single_prompt(name), 500),
+        window=args.window_ms / 1000.0,
+        max_batch=args.max_batch
+    )
+    batched = run(args.requests, args.rate, batcher.get)
+
+    report("unbatched", unbatched, unbatched_model)
+    report("batched", batched, batched_model)
+    saved = unbatched_model.calls - batched_model.calls
+    added = 1000 * (percentile(batched, 50) - percentile(unbatched, 50))
+    print(f"calls saved: {saved} ({100.0 * saved / max(1, unbatched_model.calls):.0f}%), "
+          f"added p50 latency: {added:+.1f}ms, batcher stats: {batcher.stats}")
+
+if __name__ == '__main__':
+    main()
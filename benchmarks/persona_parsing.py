@@ -0,0 +1,118 @@
+"""Compare the old regex persona parsing with streaming JSON parsing plus field repair.
+
+Persona replies are generated with the kinds of flaws seen from models that
+are asked for JSON in prose: code fences, chatter after the object, replies
+cut off by the token limit, "Tone: ..." prose and wrongly typed fields. For
+each policy it reports how many replies became a valid persona, how many
+invalid personas were accepted, how many extra model calls were made and
+how much of each reply had to be read.
+
+Usage: python benchmarks/persona_parsing.py [--replies 1000]
+"""
+import os
+import re
+import sys
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from persona_schema import JsonStreamParser, validate_persona
+from stub_model import StubModel
+
+def flawed_reply(persona, rng):
+    """A persona reply with one of the flaws seen in practice (or none)"""
+    text = json.dumps(persona)
+    flaw = rng.choice(["clean", "fenced", "chatter", "cut_introduction", "cut_traits", "prose", "wrong_types"])
+    if flaw == "fenced":
+        text = f"Here is the persona:\n```json\n{text}\n```"
+    elif flaw == "chatter":
+        text += "\n\nI hope this persona brings your object to life! " * 10
+    elif flaw == "cut_introduction":
+        text = text[:text.index('"introduction"') + 25]
+    elif flaw == "cut_traits":
+        text = text[:text.index('"traits"') + 16]
+    elif flaw == "prose":
+        text = (f"Tone: {persona['tone']}\nTraits: {', '.join(persona['traits'])}\n"
+                f"Introduction: {persona['introduction']}")
+    elif flaw == "wrong_types":
+        text = json.dumps({"tone": persona["tone"], "traits": persona["traits"], "introduction": None})
+    return flaw, text
+
+def legacy_parse(object_name, response_text):
+    """The regex extraction this replaces"""
+    try:
+        match = re.search(r'\{[\s\S]*\}', response_text)
+        if match:
+            data = json.loads(match.group(0))
+            if all(k in data for k in ["tone", "traits", "introduction"]):
+                return data
+    except Exception:
+        pass
+    tone_match = re.search(r'Tone:?\s*([\s\S]+)', response_text)
+    tone = tone_match.group(1).strip() if tone_match else "friendly"
+    traits_match = re.search(r'Traits:?\s*([\s\S]+)', response_text)
+    traits = [t.strip() for t in traits_match.group(1).split(",")] if traits_match else ["helpful", "curious"]
+    intro_match = re.search(r'[Ii]ntroduction:?\s*([\s\S]+)', response_text)
+    introduction = intro_match.group(1).strip() if intro_match else f"Hello! I am a {object_name}."
+    if not tone_match and not traits_match and not intro_match:
+        introduction = response_text.strip()
+    return {"tone": tone, "traits": traits, "introduction": introduction}
+
+def streamed_parse(response_text, chunk_size=16):
+    """(fields, missing, characters read) for a reply read in chunks until the object closes"""
+    parser = JsonStreamParser()
+    read = 0
+    for start in range(0, len(response_text), chunk_size):
+        read += len(response_text[start:start + chunk_size])
+        if parser.feed(response_text[start:start + chunk_size]) is not None:
+            break
+    persona, missing = validate_persona(parser.salvage())
+    return persona, missing, read
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    model = StubModel(latency=0, per_token_latency=0, seed=args.seed)
+    legacy = {"valid": 0, "invalid_accepted": 0, "chars_read": 0}
+    streamed = {"valid": 0, "invalid_accepted": 0, "chars_read": 0, "repair_calls": 0, "fields_repaired": 0, "failed": 0}
+    flaws = {}
+    for i in range(args.replies):
+        name = f"object {i}"
+        flaw, text = flawed_reply(model._persona(name), rng)
+        flaws[flaw] = flaws.get(flaw, 0) + 1
+
+        result = legacy_parse(name, text)
+        legacy["chars_read"] += len(text)
+        if validate_persona(result)[1]:
+            legacy["invalid_accepted"] += 1
+        else:
+            legacy["valid"] += 1
+
+        persona, missing, read = streamed_parse(text)
+        streamed["chars_read"] += read
+        if missing and persona:
+            # Only the missing fields are asked for again
+            streamed["repair_calls"] += 1
+            streamed["fields_repaired"] += len(missing)
+            repaired, missing = validate_persona(model._persona(name), missing)
+            persona.update(repaired)
+        if missing:
+            streamed["failed"] += 1
+        else:
+            streamed["valid"] += 1
+
+    print(f"replies: {args.replies} {flaws}")
+    print(f"legacy     valid={legacy['valid']:<5} invalid accepted={legacy['invalid_accepted']:<5} "
+          f"chars read={legacy['chars_read']}")
+    print(f"streaming  valid={streamed['valid']:<5} invalid accepted={streamed['invalid_accepted']:<5} "
+          f"chars read={streamed['chars_read']} repair calls={streamed['repair_calls']} "
+          f"(fields {streamed['fields_repaired']}) failed={streamed['failed']}")
+
+if __name__ == '__main__':
+    main()
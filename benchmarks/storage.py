@@ -0,0 +1,97 @@
+"""Measure the storage saved by compressed message/persona columns and their CPU cost.
+
+Builds a synthetic corpus of chat messages (short user turns, longer model
+replies) and personas, then compares the old storage (UTF-8 text, JSON
+personas) with the encodings in column_types.
+
+Usage: python benchmarks/storage.py [--messages 5000] [--personas 2000] [--seed 42]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from column_types import encode_text, decode_text, encode_persona, decode_persona, MAGIC
+
+WORDS = (
+    "the a I you my your it is was and but so of to in on for with that this what when "
+    "toaster kettle umbrella crumbs bread morning kitchen rain storm handle spout steam "
+    "honestly really always never sometimes quite rather perhaps wonderful terrible "
+    "think feel remember wonder believe know want love hate wait sit hold pour warm "
+    "day night week years people hands counter shelf drawer window coffee tea button"
+).split()
+
+TONES = ["friendly", "quirky", "wise", "dramatic", "cheerful", "grumpy", "sarcastic"]
+TRAITS = ["sturdy", "curious", "patient", "witty", "loyal", "proud", "calm", "nostalgic", "anxious"]
+
+def make_sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+    return " ".join(words).capitalize() + rng.choice([".", ".", "!", "?"])
+
+def make_messages(count, rng):
+    messages = []
+    for i in range(count):
+        sentences = rng.randint(1, 3) if i % 2 == 0 else rng.randint(3, 25)
+        messages.append(" ".join(make_sentence(rng) for _ in range(sentences)))
+    return messages
+
+def make_personas(count, rng):
+    return [{
+        "tone": rng.choice(TONES),
+        "traits": rng.sample(TRAITS, 3),
+        "introduction": " ".join(make_sentence(rng) for _ in range(rng.randint(1, 3)))
+    } for _ in range(count)]
+
+def timed(function, items):
+    """Run `function` over `items`; returns (results, microseconds per item)"""
+    started = time.perf_counter()
+    results = [function(item) for item in items]
+    return results, 1e6 * (time.perf_counter() - started) / len(items)
+
+def report(label, old_size, new_size, old_write, new_write, old_read, new_read):
+    saved = 100.0 * (old_size - new_size) / old_size if old_size else 0.0
+    print(f"{label}")
+    print(f"  stored bytes   {old_size:>12,} -> {new_size:>12,}  ({saved:.1f}% saved)")
+    print(f"  write us/item  {old_write:>12.2f} -> {new_write:>12.2f}")
+    print(f"  read us/item   {old_read:>12.2f} -> {new_read:>12.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--personas", type=int, default=2000)
+    parser.add_argument("--reads-per-persona", type=int, default=5,
+                        help="property accesses per loaded session (JSON was re-parsed on each one)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    messages = make_messages(args.messages, rng)
+    plain, plain_write = timed(lambda m: m.encode("utf-8"), messages)
+    packed, packed_write = timed(encode_text, messages)
+    _, plain_read = timed(lambda b: b.decode("utf-8"), plain)
+    decoded, packed_read = timed(decode_text, packed)
+    assert decoded == messages
+    compressed = sum(1 for value in packed if value[:1] == MAGIC)
+    report(f"Message content ({len(messages)} messages, {compressed} compressed)",
+           sum(map(len, plain)), sum(map(len, packed)),
+           plain_write, packed_write, plain_read, packed_read)
+
+    personas = make_personas(args.personas, rng)
+    as_json, json_write = timed(lambda p: json.dumps(p).encode("utf-8"), personas)
+    as_binary, binary_write = timed(encode_persona, personas)
+    reads = args.reads_per_persona
+    # Old property: json.loads on every access; new column: decoded once when the row loads
+    _, json_read = timed(lambda b: [json.loads(b) for _ in range(reads)], as_json)
+    decoded, binary_read = timed(decode_persona, as_binary)
+    assert decoded == personas
+    report(f"Personas ({len(personas)} personas, {reads} reads per loaded session)",
+           sum(map(len, as_json)), sum(map(len, as_binary)),
+           json_write, binary_write, json_read, binary_read)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
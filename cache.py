@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Optional network key-value backend
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Payloads larger than this are zlib-compressed before being stored
+COMPRESS_THRESHOLD = 1024
+
+_PLAIN = b"j"
+_COMPRESSED = b"z"
+
+def serialize(value):
+    """Encode a JSON-compatible value into the bytes every backend stores"""
+    data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    if len(data) > COMPRESS_THRESHOLD:
+        return _COMPRESSED + zlib.compress(data)
+    return _PLAIN + data
+
+def deserialize(payload):
+    """Decode bytes produced by serialize()"""
+    payload = bytes(payload)
+    if payload[:1] == _COMPRESSED:
+        return json.loads(zlib.decompress(payload[1:]))
+    return json.loads(payload[1:])
+
+def _expires_at(ttl):
+    return time.time() + ttl if ttl else None
+
+class LRUCache:
+    """In-process cache with least-recently-used eviction"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, payload)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "sets": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] <= time.time()):
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            payload = entry[1]
+        return deserialize(payload)
+
+    def set(self, key, value, ttl=None):
+        payload = serialize(value)
+        with self._lock:
+            self._entries[key] = (_expires_at(ttl), payload)
+            self._entries.move_to_end(key)
+            self.stats["sets"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class SQLiteCache:
+    """Cache in a local SQLite file shared by every worker process on the host"""
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sets_since_prune = 0
+        self._inherited = []  # connections opened before a fork; closing them could drop the parent's locks
+        self.stats = {"hits": 0, "misses": 0, "sets": 0}
+        # A short-lived connection, so nothing is left open for gunicorn --preload to fork
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, stored_at REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+
+    def _connection(self):
+        # sqlite3 connections can't be shared across threads or forked processes, so keep one per thread and process
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            if conn is not None:
+                self._inherited.append(conn)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return deserialize(row[0])
+
+    def set(self, key, value, ttl=None):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)",
+            (key, sqlite3.Binary(serialize(value)), _expires_at(ttl), time.time())
+        )
+        self._count("sets")
+        with self._lock:
+            self._sets_since_prune += 1
+            prune = self._sets_since_prune >= 1000
+            if prune:
+                self._sets_since_prune = 0
+        if prune:
+            self.prune()
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def prune(self):
+        """Drop expired entries, then the oldest ones beyond max_entries"""
+        conn = self._connection()
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+class RedisCache:
+    """Cache in Redis, shared by workers on every host"""
+
+    def __init__(self, url, prefix="objectchat:cache:"):
+        if redis is None:
+            raise RuntimeError("redis package is not installed: pip install redis")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "sets": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, key):
+        payload = self.client.get(self.prefix + key)
+        if payload is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return deserialize(payload)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, serialize(value), px=int(ttl * 1000) if ttl else None)
+        self._count("sets")
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+class TieredCache:
+    """Local L1 cache in front of a shared L2 cache
+
+    Reads try L1 first and copy L2 hits into L1. Writes and deletes go to
+    both levels. L1 entries live at most `l1_ttl` seconds so that changes
+    written by other workers become visible. Keys starting with one of
+    `shared_prefixes` are for values that change and must never be served
+    stale by one worker (a delete can't reach other workers' L1), so they
+    skip L1 altogether.
+    """
+
+    def __init__(self, l1, l2, l1_ttl=60, shared_prefixes=()):
+        self.l1 = l1
+        self.l2 = l2
+        self.l1_ttl = l1_ttl
+        self.shared_prefixes = tuple(shared_prefixes)
+
+    def _l1_ttl(self, ttl):
+        return min(ttl, self.l1_ttl) if ttl else self.l1_ttl
+
+    def _use_l1(self, key):
+        return not key.startswith(self.shared_prefixes)
+
+    def get(self, key):
+        use_l1 = self._use_l1(key)
+        value = self.l1.get(key) if use_l1 else None
+        if value is not None:
+            return value
+        try:
+            value = self.l2.get(key)
+        except Exception as e:
+            print(f"Error reading shared cache: {e}")
+            return None
+        if value is not None and use_l1:
+            self.l1.set(key, value, ttl=self.l1_ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        if self._use_l1(key):
+            self.l1.set(key, value, ttl=self._l1_ttl(ttl))
+        try:
+            self.l2.set(key, value, ttl=ttl)
+        except Exception as e:
+            print(f"Error writing shared cache: {e}")
+
+    def delete(self, key):
+        self.l1.delete(key)
+        try:
+            self.l2.delete(key)
+        except Exception as e:
+            print(f"Error deleting from shared cache: {e}")
+
+    @property
+    def stats(self):
+        return {"l1": dict(self.l1.stats), "l2": dict(self.l2.stats)}
+
+def create_cache(shared_prefixes=()):
+    """Build the cache from environment variables
+
+    CACHE_BACKEND is one of "memory", "sqlite", "redis", "memory+sqlite"
+    (the default) or "memory+redis". Keys starting with `shared_prefixes`
+    bypass the per-worker level of a two-level cache.
+    """
+    backend = os.getenv("CACHE_BACKEND", "memory+sqlite").lower()
+    l1_entries = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+    def shared(kind):
+        if kind == "sqlite":
+            path = os.getenv("CACHE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "object_chat_cache.sqlite"))
+            return SQLiteCache(path)
+        if kind == "redis":
+            return RedisCache(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+        raise ValueError(f"Unknown cache backend: {kind}")
+
+    try:
+        if backend == "memory":
+            return LRUCache(l1_entries)
+        if backend.startswith("memory+"):
+            return TieredCache(LRUCache(l1_entries), shared(backend.split("+", 1)[1]),
+                               l1_ttl=float(os.getenv("CACHE_L1_TTL", "60")), shared_prefixes=shared_prefixes)
+        return shared(backend)
+    except Exception as e:
+        print(f"Error setting up {backend} cache, using in-process cache only: {e}")
+        return LRUCache(l1_entries)
@@ -0,0 +1,50 @@
+import json
+import threading
+
+class ChatConnection:
+    """State kept resident for the lifetime of one WebSocket chat connection
+
+    The user is authenticated once when the connection opens; the active
+    chat, its persona and recent messages then stay in memory so a message
+    costs no session decode, user load or chat lookup.
+    """
+
+    def __init__(self, ws, user_id, client_key):
+        self.ws = ws
+        self.user_id = user_id
+        self.client_key = client_key
+        self.chat_session_id = None
+        self.object_name = None
+        self.persona = None
+        self.persona_pending = False
+        self.history = []
+        self._send_lock = threading.Lock()
+
+    def send(self, **message):
+        # Pushes come from worker threads, so sends are serialized per connection
+        with self._send_lock:
+            self.ws.send(json.dumps(message))
+
+class ConnectionRegistry:
+    """Open chat connections, so background work can push to them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = set()
+
+    def add(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+
+    def remove(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+    def waiting_for(self, object_name):
+        """Connections still using a fallback persona for `object_name`"""
+        with self._lock:
+            return [c for c in self._connections if c.persona_pending and c.object_name == object_name]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._connections)
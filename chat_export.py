@@ -0,0 +1,341 @@
+import os
+import json
+import zlib
+import heapq
+import argparse
+from datetime import datetime
+from sqlalchemy import select, insert
+from models import db, User, ChatSession, ChatMessage, ChatArchive
+from archive import decode_archived_messages
+from persona_schema import validate_persona
+
+EXPORT_VERSION = 1
+
+# Rows fetched per round trip from the server-side cursors
+YIELD_PER = 500
+
+# Lines are sent in chunks of about this many bytes
+CHUNK_SIZE = 64 * 1024
+
+# Gzip output is split into independent members of about this many
+# uncompressed bytes, so a truncated download still decompresses up to the
+# last complete member and can be resumed from there
+GZIP_MEMBER_SIZE = 1024 * 1024
+
+def parse_cursor(cursor):
+    """Turn a "<session id>:<message id>" cursor into a pair of ints (0, 0 when empty)"""
+    if not cursor:
+        return 0, 0
+    session_id, _, message_id = cursor.partition(":")
+    session_id, message_id = int(session_id), int(message_id or 0)
+    if session_id < 0 or message_id < 0:
+        raise ValueError(f"Invalid export cursor: {cursor}")
+    return session_id, message_id
+
+def cursor_after(record):
+    """Cursor that resumes an export right after `record`"""
+    if record["type"] == "message":
+        return f"{record['session_id']}:{record['id']}"
+    if record["type"] == "session":
+        return f"{record['id']}:0"
+    return record.get("cursor")
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def _parse_iso(value):
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    return datetime.fromisoformat(value) if value else None
+
+def _field(record, name, types, required=True):
+    """A record field, checked against `types`; raises ValueError for a malformed export"""
+    value = record.get(name)
+    if value is None and not required:
+        return None
+    if not isinstance(value, types) or isinstance(value, bool):
+        raise ValueError(f"Invalid {record.get('type')} record: bad {name!r}")
+    return value
+
+def _imported_persona(value):
+    """A complete, valid persona from an export, or None so a new one is generated"""
+    persona, missing = validate_persona(value)
+    return None if missing else persona
+
+def export_records(user_id, cursor=None):
+    """Yield a user's chats and their messages, including archived ones, as dicts
+
+    Rows are read through server-side cursors, so memory use doesn't depend
+    on the size of the account. Chats come in id order and messages in id
+    order within a chat; `cursor` skips everything up to and including the
+    record it was taken from.
+    """
+    after_session, after_message = parse_cursor(cursor)
+    yield {"type": "export", "version": EXPORT_VERSION, "exported_at": _iso(datetime.utcnow()), "cursor": cursor}
+
+    sessions = db.session.execute(
+        select(ChatSession.id, ChatSession.object_name, ChatSession.title, ChatSession._persona,
+               ChatSession.created_at, ChatSession.updated_at,
+               (ChatArchive.chat_session_id != None).label("archived"))
+        .outerjoin(ChatArchive, ChatArchive.chat_session_id == ChatSession.id)
+        .where(ChatSession.user_id == user_id, ChatSession.id >= after_session)
+        .order_by(ChatSession.id)
+        .execution_options(yield_per=YIELD_PER)
+    )
+    for chat in sessions:
+        first_message = 0
+        if chat.id == after_session:
+            first_message = after_message
+        else:
+            yield {
+                "type": "session",
+                "id": chat.id,
+                "object_name": chat.object_name,
+                "title": chat.title,
+                "persona": chat._persona,
+                "created_at": _iso(chat.created_at),
+                "updated_at": _iso(chat.updated_at)
+            }
+
+        hot = db.session.execute(
+            select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.timestamp)
+            .where(ChatMessage.chat_session_id == chat.id, ChatMessage.id > first_message)
+            .order_by(ChatMessage.id)
+            .execution_options(yield_per=YIELD_PER)
+        )
+        # Messages of an idle chat may be partly in its archive
+        archived = []
+        if chat.archived:
+            data = db.session.execute(select(ChatArchive.data).where(ChatArchive.chat_session_id == chat.id)).scalar()
+            archived = sorted((m for m in decode_archived_messages(data) if m["id"] > first_message),
+                              key=lambda m: m["id"])
+        for message in heapq.merge(archived, (row._asdict() for row in hot), key=lambda m: m["id"]):
+            yield {
+                "type": "message",
+                "session_id": chat.id,
+                "id": message["id"],
+                "role": message["role"],
+                "content": message["content"],
+                "timestamp": _iso(message["timestamp"])
+            }
+
+def ndjson_chunks(records, chunk_size=CHUNK_SIZE):
+    """Encode records as NDJSON, grouped into chunks that always end on a line boundary"""
+    buffer = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+def gzip_chunks(chunks, member_size=GZIP_MEMBER_SIZE, level=6):
+    """Gzip a stream of chunks, starting a new gzip member every `member_size` bytes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    written = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        written += len(chunk)
+        if written >= member_size:
+            data += compressor.flush()
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            written = 0
+        if data:
+            yield data
+    yield compressor.flush()
+
+def decompressed_chunks(chunks):
+    """Undo gzip_chunks (any number of members); plain NDJSON passes through"""
+    chunks = iter(chunks)
+    first = next(chunks, b"")
+    if first[:2] != b"\x1f\x8b":
+        yield first
+        yield from chunks
+        return
+
+    decompressor = zlib.decompressobj(31)
+    pending = first
+    while True:
+        while pending:
+            yield decompressor.decompress(pending)
+            if not decompressor.eof:
+                break
+            # End of one member; anything left over is the start of the next
+            pending = decompressor.unused_data
+            decompressor = zlib.decompressobj(31)
+        pending = next(chunks, None)
+        if pending is None:
+            return
+
+def read_records(chunks):
+    """Parse NDJSON records from a stream of (possibly gzipped) chunks
+
+    A final line cut short by an interrupted transfer is dropped.
+    """
+    partial = b""
+    for data in decompressed_chunks(chunks):
+        lines = (partial + data).split(b"\n")
+        partial = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if partial.strip():
+        try:
+            yield json.loads(partial)
+        except ValueError:
+            pass
+
+def import_records(user_id, records, batch_size=1000):
+    """Add exported chats to a user's account, inserting messages in batches
+
+    Chats get new ids. Returns counts of sessions and messages imported and
+    of messages skipped because their chat wasn't in the stream. A malformed
+    record raises ValueError; batches committed before it stay imported.
+    """
+    report = {"sessions": 0, "messages": 0, "skipped": 0}
+    session_ids = {}  # exported id -> new id
+    pending = []
+
+    def flush():
+        if pending:
+            db.session.execute(insert(ChatMessage), pending)
+            report["messages"] += len(pending)
+            pending.clear()
+        db.session.commit()
+
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"Invalid record: expected an object, got {type(record).__name__}")
+        if record.get("type") == "session":
+            exported_id = _field(record, "id", int)
+            object_name = _field(record, "object_name", str)
+            if not object_name.strip() or len(object_name) > 64:
+                raise ValueError("Invalid session record: bad 'object_name'")
+            title = _field(record, "title", str, required=False)
+            chat_session = ChatSession(
+                user_id=user_id,
+                object_name=object_name,
+                title=title[:128] if title else None,
+                persona=_imported_persona(record.get("persona")),
+                created_at=_parse_iso(record.get("created_at")) or datetime.utcnow(),
+                updated_at=_parse_iso(record.get("updated_at")) or datetime.utcnow()
+            )
+            db.session.add(chat_session)
+            db.session.flush()
+            session_ids[exported_id] = chat_session.id
+            report["sessions"] += 1
+        elif record.get("type") == "message":
+            role = _field(record, "role", str)
+            if role not in ("user", "assistant"):
+                raise ValueError(f"Invalid message record: bad role {role!r}")
+            content = _field(record, "content", str)
+            chat_session_id = session_ids.get(_field(record, "session_id", int))
+            if chat_session_id is None:
+                report["skipped"] += 1
+                continue
+            pending.append({
+                "chat_session_id": chat_session_id,
+                "role": role,
+                "content": content,
+                "timestamp": _parse_iso(record.get("timestamp")) or datetime.utcnow()
+            })
+            if len(pending) >= batch_size:
+                flush()
+    flush()
+    return report
+
+def _file_chunks(path, size=CHUNK_SIZE):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+def resume_point(path):
+    """(bytes to keep, cursor) for an interrupted export file
+
+    Only complete lines count, and for gzip files only complete members.
+    """
+    with open(path, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    keep = 0
+    last_line = None
+    if not gzipped:
+        offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                offset += len(line)
+                if line.endswith(b"\n"):
+                    keep = offset
+                    if line.strip():
+                        last_line = line
+    else:
+        consumed = 0
+        decompressor = zlib.decompressobj(31)
+        tail = b""  # the last line decompressed so far
+        for chunk in _file_chunks(path):
+            consumed += len(chunk)
+            pending = chunk
+            while pending:
+                tail += decompressor.decompress(pending)
+                cut = tail.rfind(b"\n", 0, len(tail) - 1)
+                if cut >= 0:
+                    tail = tail[cut + 1:]
+                if not decompressor.eof:
+                    break
+                # Members always end on a line boundary
+                pending = decompressor.unused_data
+                keep = consumed - len(pending)
+                if tail.strip():
+                    last_line = tail
+                decompressor = zlib.decompressobj(31)
+                tail = b""
+    cursor = cursor_after(json.loads(last_line)) if last_line else None
+    return keep, cursor
+
+def export_to_file(user_id, path, compress=False, resume=False):
+    """Write a user's export to `path`, continuing an interrupted one when `resume` is set"""
+    cursor = None
+    mode = "wb"
+    if resume and os.path.exists(path) and os.path.getsize(path):
+        keep, cursor = resume_point(path)
+        with open(path, "r+b") as f:
+            f.truncate(keep)
+        mode = "ab"
+        print(f"Resuming export after cursor {cursor}")
+    chunks = ndjson_chunks(export_records(user_id, cursor))
+    if compress:
+        chunks = gzip_chunks(chunks)
+    written = 0
+    with open(path, mode) as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a user's chats as NDJSON, or import such an export")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("--user", required=True, help="username to export from or import into")
+    parser.add_argument("--file", required=True, help="NDJSON file; gzip is used when it ends in .gz")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted export")
+    parser.add_argument("--batch-size", type=int, default=1000, help="messages inserted per transaction on import")
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        user = User.query.filter_by(username=args.user).first()
+        if not user:
+            raise SystemExit(f"User {args.user} not found")
+        if args.action == "export":
+            written = export_to_file(user.id, args.file, compress=args.file.endswith(".gz"), resume=args.resume)
+            print(f"Wrote {written} bytes to {args.file}")
+        else:
+            report = import_records(user.id, read_records(_file_chunks(args.file)), args.batch_size)
+            print(f"Imported {report['sessions']} chat sessions and {report['messages']} messages "
+                  f"({report['skipped']} messages without a chat skipped)")
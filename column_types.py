@@ -0,0 +1,198 @@
+import json
+import zlib
+from sqlalchemy import inspect
+from sqlalchemy.types import TypeDecorator, LargeBinary
+
+# Stored values start with a marker byte, a format version and a codec byte.
+# 0xFF never starts valid UTF-8, so rows written before compression (plain
+# text) are still recognised and read correctly.
+MAGIC = b"\xff"
+FORMAT_VERSION = 1
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+
+# Persona bodies are either the compact field encoding or JSON for odd shapes
+PERSONA_FIELDS = 0
+PERSONA_JSON = 1
+
+# Whether each kind of column is written in the binary format. On PostgreSQL the
+# columns stay text until migrate_compression.py has converted them to bytea, and
+# until then values are written as plain text the previous release can read.
+PACKED_WRITES = {"text": True, "persona": True}
+
+STORAGE_COLUMNS = {"text": ("chat_message", "content"), "persona": ("chat_session", "_persona")}
+
+def configure_storage_format(engine):
+    """Write the binary format only to columns that can hold it; returns PACKED_WRITES"""
+    for kind, (table, column) in STORAGE_COLUMNS.items():
+        packed = True
+        if engine.dialect.name == "postgresql":
+            columns = {c["name"]: c["type"] for c in inspect(engine).get_columns(table)}
+            packed = column not in columns or type(columns[column]).__name__.upper() == "BYTEA"
+        PACKED_WRITES[kind] = packed
+    return PACKED_WRITES
+
+def _pack(body, threshold):
+    if len(body) > threshold:
+        compressed = zlib.compress(body, 6)
+        if len(compressed) < len(body):
+            return MAGIC + bytes([FORMAT_VERSION, CODEC_ZLIB]) + compressed
+    return MAGIC + bytes([FORMAT_VERSION, CODEC_RAW]) + body
+
+def _unpack(value):
+    """Return the body of a packed value, or None for legacy unpacked data"""
+    value = bytes(value)
+    if value[:1] != MAGIC:
+        return None
+    version, codec = value[1], value[2]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported stored format version {version}")
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(value[3:])
+    if codec == CODEC_RAW:
+        return value[3:]
+    raise ValueError(f"Unsupported stored codec {codec}")
+
+def encode_text(text, threshold=256):
+    """Encode text for storage, compressing it when it is longer than `threshold` bytes
+
+    Text that isn't compressed is stored as plain UTF-8 without a header
+    (UTF-8 never starts with MAGIC), so short messages don't grow.
+    """
+    body = text.encode("utf-8")
+    packed = _pack(body, threshold)
+    return packed if packed[2] == CODEC_ZLIB else body
+
+def decode_text(value):
+    """Decode stored text; also accepts rows written before compression"""
+    if isinstance(value, str):
+        return value
+    body = _unpack(value)
+    return bytes(value).decode("utf-8") if body is None else body.decode("utf-8")
+
+def _write_varint(out, number):
+    while True:
+        byte = number & 0x7F
+        number >>= 7
+        if number:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+def _read_varint(data, pos):
+    number = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        number |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return number, pos
+        shift += 7
+
+def _write_string(out, text):
+    encoded = text.encode("utf-8")
+    _write_varint(out, len(encoded))
+    out.extend(encoded)
+
+def _read_string(data, pos):
+    length, pos = _read_varint(data, pos)
+    return data[pos:pos + length].decode("utf-8"), pos + length
+
+def encode_persona(persona, threshold=512):
+    """Encode a persona as length-prefixed tone, traits and introduction
+
+    Personas that don't have exactly that shape (extra keys, non-string
+    values) are stored as compact JSON instead.
+    """
+    out = bytearray()
+    traits = persona.get("traits")
+    if (set(persona) == {"tone", "traits", "introduction"}
+            and isinstance(persona["tone"], str) and isinstance(persona["introduction"], str)
+            and isinstance(traits, list) and all(isinstance(t, str) for t in traits)):
+        out.append(PERSONA_FIELDS)
+        _write_string(out, persona["tone"])
+        _write_varint(out, len(traits))
+        for trait in traits:
+            _write_string(out, trait)
+        _write_string(out, persona["introduction"])
+    else:
+        out.append(PERSONA_JSON)
+        out.extend(json.dumps(persona, separators=(",", ":")).encode("utf-8"))
+    return _pack(bytes(out), threshold)
+
+def decode_persona(value):
+    """Decode a stored persona; also accepts the JSON text written before this format"""
+    if isinstance(value, str):
+        return json.loads(value)
+    body = _unpack(value)
+    if body is None:
+        return json.loads(bytes(value).decode("utf-8"))
+    if body[0] == PERSONA_JSON:
+        return json.loads(body[1:].decode("utf-8"))
+    tone, pos = _read_string(body, 1)
+    count, pos = _read_varint(body, pos)
+    traits = []
+    for _ in range(count):
+        trait, pos = _read_string(body, pos)
+        traits.append(trait)
+    introduction, pos = _read_string(body, pos)
+    return {"tone": tone, "traits": traits, "introduction": introduction}
+
+class _BinaryOrText(TypeDecorator):
+    """Binary column that also passes str through unchanged, in both directions
+
+    str is what plain text writes bind (see PACKED_WRITES) and what a
+    PostgreSQL text column not yet converted to bytea returns.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def result_processor(self, dialect, coltype):
+        binary = self.impl_instance.result_processor(dialect, coltype)
+
+        def process(value):
+            if binary is not None and value is not None and not isinstance(value, str):
+                value = binary(value)
+            return self.process_result_value(value, dialect)
+        return process
+
+    def bind_processor(self, dialect):
+        binary = self.impl_instance.bind_processor(dialect)
+
+        def process(value):
+            value = self.process_bind_param(value, dialect)
+            if value is None or isinstance(value, str) or binary is None:
+                return value
+            return binary(value)
+        return process
+
+class CompressedText(_BinaryOrText):
+    """Text column stored as bytes, zlib-compressed above a size threshold"""
+    cache_ok = True
+
+    def __init__(self, threshold=256, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not PACKED_WRITES["text"]:
+            return value
+        return encode_text(value, self.threshold)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else decode_text(value)
+
+class PersonaType(_BinaryOrText):
+    """Persona dict column in the compact binary encoding, decoded once when a row is loaded"""
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not PACKED_WRITES["persona"]:
+            return json.dumps(value)
+        return encode_persona(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else decode_persona(value)
@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+from collections import deque
+
+from flask import has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool, QueuePool
+
+REPLICA_BIND = "replica"
+
+# How long after a write a client keeps reading from the primary, so replica
+# lag never hides something they just saved
+READ_YOUR_WRITES_SECONDS = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', '5'))
+
+class PoolWaitStats:
+    """Checkout wait times for one connection pool"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self._recent.append(seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            p95 = recent[int(0.95 * (len(recent) - 1))] if recent else 0.0
+            return {
+                "checkouts": self.count,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(1000 * self.total / self.count, 3) if self.count else 0.0,
+                "p95_wait_ms": round(1000 * p95, 3),
+                "max_wait_ms": round(1000 * self.max, 3)
+            }
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.wait_stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - started)
+        return connection
+
+def build_engine_options(database_url):
+    """SQLAlchemy engine options for the configured database and worker layout
+
+    The pool is sized per gunicorn worker: one connection per request thread
+    plus a couple for background threads, capped so that all workers together
+    stay within DB_MAX_CONNECTIONS. With DB_PGBOUNCER=true the app keeps no
+    pool of its own and leaves pooling to PgBouncer in transaction mode.
+    """
+    if database_url.startswith('sqlite'):
+        # In-memory databases need SQLAlchemy's default single-connection pool
+        if ':memory:' in database_url or database_url.rstrip('/') == 'sqlite:':
+            return {}
+        return {"poolclass": TimedQueuePool}
+
+    if os.getenv('DB_PGBOUNCER', 'False').lower() == 'true':
+        return {"poolclass": NullPool}
+
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+    threads = max(1, int(os.getenv('GUNICORN_THREADS', '1')))
+    pool_size = threads + 2
+    max_overflow = threads
+
+    max_connections = os.getenv('DB_MAX_CONNECTIONS')
+    if max_connections:
+        per_worker = max(1, int(max_connections) // workers)
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.getenv('DB_POOL_SIZE', pool_size)),
+        "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', max_overflow)),
+        "pool_timeout": float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        # Recycle before typical server/load balancer idle timeouts kill the connection
+        "pool_recycle": int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        "pool_pre_ping": os.getenv('DB_POOL_PRE_PING', 'True').lower() == 'true'
+    }
+
+def configure_database(app):
+    """Set the database URLs and pool options on the Flask app config"""
+    database_url = os.getenv('DATABASE_URL', 'sqlite:///object_chat.db').replace('postgres://', 'postgresql://', 1)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(database_url)
+
+    replica_url = os.getenv('DATABASE_REPLICA_URL')
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: {
+                "url": replica_url.replace('postgres://', 'postgresql://', 1),
+                **build_engine_options(replica_url)
+            }
+        }
+
+def pool_stats(engine):
+    """Current size, usage and checkout wait times of an engine's pool"""
+    pool = engine.pool
+    stats = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(0, pool._max_overflow)
+        stats.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "saturation": round(pool.checkedout() / capacity, 3) if capacity else 0.0
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update(pool.wait_stats.snapshot())
+    return stats
+
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores ON DELETE CASCADE unless foreign keys are switched on per connection
+    if type(dbapi_connection).__module__.startswith("sqlite3"):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+class RoutingSession(Session):
+    """Session that sends plain reads to the replica bind when one is configured
+
+    Anything inside a transaction that has written, any locking read, and any
+    read by a client that wrote in the last few seconds goes to the primary.
+    So does everything outside a request (CLIs and background threads), which
+    has no client to pin and often reads back what it just committed.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if clause is not None and not getattr(clause, "is_select", False):
+            # insert()/update()/delete() and text() sent through session.execute never flush
+            self.info["wrote"] = True
+        if bind is None and self._can_use_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _can_use_replica(self, clause):
+        if clause is None or not getattr(clause, "is_select", False):
+            return False
+        if getattr(clause, "_for_update_arg", None) is not None:
+            return False
+        if self._flushing or self.info.get("wrote") or self.new or self.dirty or self.deleted:
+            return False
+        if REPLICA_BIND not in self._db.engines or not has_request_context():
+            return False
+        if flask_session.get('_db_primary_until', 0) > time.time():
+            return False
+        return True
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_write(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "after_commit")
+def _pin_client_to_primary(session):
+    if session.info.pop("wrote", False) and has_request_context():
+        flask_session['_db_primary_until'] = time.time() + READ_YOUR_WRITES_SECONDS
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _clear_write(session):
+    session.info.pop("wrote", None)
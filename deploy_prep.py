@@ -66,6 +66,9 @@ if __name__ == '__main__':
         # Run database setup
         setup_database()
         print("Database setup completed successfully")
+        # Idempotent; the app relies on ON DELETE CASCADE to delete a chat's messages
+        from migrate_cascades import migrate_cascades
+        migrate_cascades()
     except Exception as e:
         print(f"Fatal error in deploy_prep.py: {e}")
         traceback.print_exc()
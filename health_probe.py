@@ -0,0 +1,124 @@
+import time
+import threading
+from datetime import datetime
+
+class HealthProber:
+    """Background threads that check dependencies and cache the results for the probe endpoints
+
+    Each check is a function returning a dict of details with "ok" set to
+    False when the dependency is unhealthy (raising counts as unhealthy).
+    Checks run every `interval` seconds, or every `every` seconds if given
+    when the check is added. Only critical checks decide readiness. If no
+    round of critical checks finished within `stale_after` seconds, e.g.
+    because a check hangs on a wedged connection, the worker is reported
+    not ready.
+
+    Non-critical checks run on a thread of their own, each call limited to
+    `timeout` seconds, so a slow or hung dependency that is only reported
+    can't hold up the critical checks or make them look stale.
+    """
+
+    def __init__(self, app, interval=10.0, stale_after=None):
+        self.app = app
+        self.interval = interval
+        self.stale_after = stale_after or 3 * interval
+        self._checks = {}  # name -> (fn, critical, every, timeout)
+        self._results = {}  # name -> latest result
+        self._ran_at = {}  # name -> monotonic time of the latest run
+        self._calls = {}  # name -> thread of a timed call that may still be running
+        self._last_round = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self.rounds = 0
+        self.started_at = time.time()
+
+    def add_check(self, name, fn, critical=True, every=None, timeout=None):
+        self._checks[name] = (fn, critical, every or self.interval, timeout)
+
+    def start(self):
+        # Started lazily so each gunicorn worker gets its own threads after fork
+        with self._lock:
+            if self._threads:
+                return
+            kinds = [True]
+            if any(not critical for _, critical, _, _ in self._checks.values()):
+                kinds.append(False)
+            for critical in kinds:
+                name = "health-prober" if critical else "health-prober-background"
+                thread = threading.Thread(target=self._loop, args=(critical,), name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def is_alive(self):
+        return all(thread.is_alive() for thread in self._threads)
+
+    def _loop(self, critical):
+        while True:
+            try:
+                self.run_once(critical)
+            except Exception as e:
+                print(f"Error running health checks: {e}")
+            time.sleep(self.interval)
+
+    def _call(self, name, fn, timeout):
+        """Run a check on its own thread, giving up on it after `timeout` seconds"""
+        previous = self._calls.get(name)
+        if previous is not None and previous.is_alive():
+            raise TimeoutError("the previous check has not returned yet")
+        outcome = {}
+
+        def target():
+            with self.app.app_context():
+                try:
+                    outcome["result"] = fn()
+                except Exception as e:
+                    outcome["error"] = e
+
+        thread = threading.Thread(target=target, name=f"health-check-{name}", daemon=True)
+        self._calls[name] = thread
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            raise TimeoutError(f"no answer after {timeout}s")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result")
+
+    def run_once(self, critical=True):
+        """Run the critical (or the other) checks that are due and cache their results"""
+        with self.app.app_context():
+            for name, (fn, is_critical, every, timeout) in list(self._checks.items()):
+                if is_critical != critical:
+                    continue
+                if name in self._ran_at and time.monotonic() - self._ran_at[name] < every - 0.001:
+                    continue
+                started = time.perf_counter()
+                try:
+                    result = dict((fn() if timeout is None else self._call(name, fn, timeout)) or {})
+                    result.setdefault("ok", True)
+                except Exception as e:
+                    result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                result["critical"] = is_critical
+                result["check_ms"] = round(1000 * (time.perf_counter() - started), 2)
+                result["checked_at"] = datetime.utcnow().isoformat()
+                # Replacing whole entries keeps readers lock-free
+                self._results[name] = result
+                self._ran_at[name] = time.monotonic()
+        if critical:
+            self._last_round = time.monotonic()
+            self.rounds += 1
+
+    def snapshot(self):
+        """Cached readiness and check results; never runs a check itself"""
+        if self._last_round is None:
+            return {"ready": False, "reason": "starting", "age_s": None, "checks": dict(self._results)}
+        checks = dict(self._results)
+        age = time.monotonic() - self._last_round
+        failing = sorted(name for name, result in checks.items() if result["critical"] and not result["ok"])
+        if age > self.stale_after:
+            reason = f"no health checks completed for {age:.0f}s"
+        elif failing:
+            reason = f"failing: {', '.join(failing)}"
+        else:
+            reason = None
+        return {"ready": reason is None, "reason": reason, "age_s": round(age, 3), "checks": checks}
@@ -0,0 +1,74 @@
+import gzip
+from datetime import timezone
+
+from flask import request
+
+# Optional: brotli compresses text better than gzip when the browser supports it
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "application/javascript"
+}
+
+def init_compression(app, min_size=500, gzip_level=6, brotli_quality=5):
+    """Compress JSON and HTML responses for clients that accept it"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        if brotli is not None and request.accept_encodings["br"]:
+            response.set_data(brotli.compress(data, quality=brotli_quality))
+            response.headers["Content-Encoding"] = "br"
+        elif request.accept_encodings["gzip"]:
+            response.set_data(gzip.compress(data, compresslevel=gzip_level))
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        # The compressed bytes differ from the original, so a strong ETag no longer holds
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    return compress_response
+
+def chat_validators(chat_session):
+    """ETag and Last-Modified for a chat session's message history"""
+    last_modified = (chat_session.updated_at or chat_session.created_at).replace(tzinfo=timezone.utc)
+    etag = f"chat-{chat_session.id}-{int(last_modified.timestamp() * 1000000)}"
+    return etag, last_modified
+
+def is_not_modified(etag, last_modified):
+    """Whether the request's conditional headers match the current validators"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since:
+        # HTTP dates only have one-second precision
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def set_validators(response, etag, last_modified):
+    """Attach validators and require revalidation on every reuse"""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
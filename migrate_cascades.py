@@ -0,0 +1,101 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+from app import app, db
+from models import ChatSession, ChatMessage
+
+# (table, column, referenced table) for every foreign key that should cascade
+CASCADES = [
+    (ChatSession.__table__, "user_id", "user"),
+    (ChatMessage.__table__, "chat_session_id", "chat_session")
+]
+
+def find_foreign_key(inspector, table_name, column):
+    for fk in inspector.get_foreign_keys(table_name):
+        if fk["constrained_columns"] == [column]:
+            return fk
+    return None
+
+def is_cascading(fk):
+    return fk is not None and (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE"
+
+def migrate_postgresql(engine):
+    """Swap the foreign keys for ON DELETE CASCADE ones without long table locks"""
+    inspector = inspect(engine)
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table, column, referenced in CASCADES:
+            index_name = f"ix_{table.name}_{column}"
+            print(f"Creating index {index_name}...")
+            conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON "{table.name}" ({column})'))
+
+            fk = find_foreign_key(inspector, table.name, column)
+            if is_cascading(fk):
+                print(f"{table.name}.{column} already cascades")
+                continue
+
+            new_name = f"{table.name}_{column}_cascade_fkey"
+            print(f"Replacing foreign key on {table.name}.{column}...")
+            # NOT VALID takes only a brief lock; VALIDATE then scans without blocking writes
+            with conn.begin():
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD CONSTRAINT {new_name} '
+                    f'FOREIGN KEY ({column}) REFERENCES "{referenced}" (id) ON DELETE CASCADE NOT VALID'
+                ))
+                if fk is not None and fk.get("name"):
+                    conn.execute(text(f'ALTER TABLE "{table.name}" DROP CONSTRAINT "{fk["name"]}"'))
+            conn.execute(text(f'ALTER TABLE "{table.name}" VALIDATE CONSTRAINT {new_name}'))
+
+def migrate_sqlite(engine):
+    """Rebuild the tables, since SQLite can't alter an existing foreign key"""
+    inspector = inspect(engine)
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        conn.isolation_level = None  # issue BEGIN/COMMIT ourselves so each rebuild is atomic
+        conn.execute("PRAGMA foreign_keys=OFF")
+        # Keep references from other tables pointing at the name, not the renamed table
+        conn.execute("PRAGMA legacy_alter_table=ON")
+        for table, column, referenced in CASCADES:
+            if is_cascading(find_foreign_key(inspector, table.name, column)):
+                print(f"{table.name}.{column} already cascades")
+                continue
+
+            print(f"Rebuilding {table.name}...")
+            old_name = f"_{table.name}_old"
+            old_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            columns = ", ".join(c.name for c in table.columns if c.name in old_columns)
+            conn.execute("BEGIN")
+            try:
+                conn.execute(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"')
+                for index in inspector.get_indexes(table.name):
+                    conn.execute(f'DROP INDEX IF EXISTS "{index["name"]}"')
+                conn.execute(str(CreateTable(table).compile(dialect=engine.dialect)))
+                for index in table.indexes:
+                    conn.execute(str(CreateIndex(index).compile(dialect=engine.dialect)))
+                conn.execute(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{old_name}"')
+                conn.execute(f'DROP TABLE "{old_name}"')
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"Rebuilt {table.name} with ON DELETE CASCADE")
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+        conn.execute("PRAGMA foreign_keys=ON")
+    finally:
+        # Don't hand a connection with changed pragmas back to the pool
+        raw.invalidate()
+
+def migrate_cascades():
+    with app.app_context():
+        engine = db.engine
+        print(f"Adding ON DELETE CASCADE foreign keys on {engine.dialect.name}...")
+        if engine.dialect.name == "postgresql":
+            migrate_postgresql(engine)
+        elif engine.dialect.name == "sqlite":
+            migrate_sqlite(engine)
+        else:
+            raise RuntimeError(f"Unsupported database: {engine.dialect.name}")
+        print("Migration completed successfully!")
+
+if __name__ == '__main__':
+    migrate_cascades()
@@ -0,0 +1,118 @@
+import argparse
+from sqlalchemy import inspect, text
+from app import app, db
+from column_types import decode_text, encode_text, decode_persona, encode_persona
+
+# (table, column, convert legacy value -> packed bytes, nullable)
+TARGETS = [
+    ("chat_message", "content", lambda value: encode_text(decode_text(value)), False),
+    ("chat_session", "_persona", lambda value: encode_persona(decode_persona(value)), True)
+]
+
+def _is_converted(value):
+    # Rows written by this release are bytes (short text is stored as plain UTF-8 bytes)
+    return isinstance(value, (bytes, memoryview))
+
+def _raw_size(value):
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(bytes(value))
+
+def convert_in_place(engine, table, column, convert, batch_size):
+    """Re-encode rows batch by batch in the same column (SQLite stores bytes in any column)"""
+    raw_bytes = packed_bytes = rows = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            batch = conn.execute(text(
+                f'SELECT id, "{column}" FROM "{table}" WHERE id > :last_id ORDER BY id LIMIT :limit'
+            ), {"last_id": last_id, "limit": batch_size}).all()
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            updates = []
+            for row_id, value in batch:
+                if value is None or _is_converted(value):
+                    continue
+                packed = convert(value)
+                raw_bytes += _raw_size(value)
+                packed_bytes += len(packed)
+                updates.append({"id": row_id, "value": packed})
+            if updates:
+                conn.execute(text(f'UPDATE "{table}" SET "{column}" = :value WHERE id = :id'), updates)
+            rows += len(updates)
+        print(f"  {table}.{column}: {rows} rows converted (up to id {last_id})")
+    return rows, raw_bytes, packed_bytes
+
+def convert_to_bytea(engine, table, column, convert, nullable, batch_size, swap=True):
+    """Backfill a new bytea column in batches, then swap it in under a short lock
+
+    With `swap` off only the backfill runs, which is safe while the app is up.
+    """
+    packed_column = f"{column}_packed"
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{packed_column}" bytea'))
+
+    def backfill(conn, last_id, limit):
+        batch = conn.execute(text(
+            f'SELECT id, "{column}" FROM "{table}" '
+            f'WHERE "{packed_column}" IS NULL AND "{column}" IS NOT NULL AND id > :last_id ORDER BY id LIMIT :limit'
+        ), {"last_id": last_id, "limit": limit}).all()
+        updates = [{"id": row_id, "value": convert(value)} for row_id, value in batch]
+        if updates:
+            conn.execute(text(f'UPDATE "{table}" SET "{packed_column}" = :value WHERE id = :id'), updates)
+        sizes = (sum(_raw_size(value) for _, value in batch), sum(len(u["value"]) for u in updates))
+        return batch, sizes
+
+    raw_bytes = packed_bytes = rows = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            batch, (raw, packed) = backfill(conn, last_id, batch_size)
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        rows += len(batch)
+        raw_bytes += raw
+        packed_bytes += packed
+        print(f"  {table}.{column}: {rows} rows converted (up to id {last_id})")
+    if not swap:
+        return rows, raw_bytes, packed_bytes
+
+    with engine.begin() as conn:
+        # Rows written while the backfill ran are converted under the lock, then the columns swap
+        conn.execute(text(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE'))
+        while True:
+            batch, (raw, packed) = backfill(conn, 0, batch_size)
+            if not batch:
+                break
+            rows += len(batch)
+            raw_bytes += raw
+            packed_bytes += packed
+        conn.execute(text(f'ALTER TABLE "{table}" DROP COLUMN "{column}"'))
+        conn.execute(text(f'ALTER TABLE "{table}" RENAME COLUMN "{packed_column}" TO "{column}"'))
+        if not nullable:
+            conn.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN "{column}" SET NOT NULL'))
+    return rows, raw_bytes, packed_bytes
+
+def migrate_compression(batch_size=1000, backfill_only=False):
+    with app.app_context():
+        engine = db.engine
+        inspector = inspect(engine)
+        print(f"Converting message content and personas to the compressed format on {engine.dialect.name}...")
+        for table, column, convert, nullable in TARGETS:
+            column_type = next(c["type"] for c in inspector.get_columns(table) if c["name"] == column)
+            if engine.dialect.name == "postgresql" and column_type.__class__.__name__.upper() != "BYTEA":
+                rows, raw_bytes, packed_bytes = convert_to_bytea(engine, table, column, convert, nullable, batch_size,
+                                                                 swap=not backfill_only)
+            else:
+                rows, raw_bytes, packed_bytes = convert_in_place(engine, table, column, convert, batch_size)
+            saved = raw_bytes - packed_bytes
+            print(f"{table}.{column}: converted {rows} rows, {raw_bytes} -> {packed_bytes} bytes ({saved} bytes saved)")
+        print("Migration completed successfully!")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert existing rows to the compressed storage format")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--backfill-only", action="store_true",
+                        help="PostgreSQL: fill the new bytea columns without swapping them in (safe while the app runs)")
+    args = parser.parse_args()
+    migrate_compression(args.batch_size, args.backfill_only)
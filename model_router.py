@@ -0,0 +1,185 @@
+import time
+import threading
+from collections import Counter, deque
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[int(pct / 100.0 * (len(ordered) - 1))] if ordered else 0.0
+
+class ModelHealth:
+    """Recent latency and outcomes of one model, with a simple circuit breaker
+
+    Only calls from the last `window` seconds count, so a model that was
+    routed away from because it was slow becomes eligible again once its
+    bad samples age out.
+    """
+
+    def __init__(self, window=60.0, failures_to_open=3, cooldown=30.0):
+        self.window = window
+        self.failures_to_open = failures_to_open
+        self.cooldown = cooldown
+        self.samples = deque()  # (finished at, seconds, ok)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.calls = 0
+        self.failures = 0
+
+    def _trim(self, now):
+        while self.samples and self.samples[0][0] < now - self.window:
+            self.samples.popleft()
+
+    def record(self, seconds, ok):
+        now = time.monotonic()
+        self.calls += 1
+        self.samples.append((now, seconds, ok))
+        self._trim(now)
+        if ok:
+            self.consecutive_failures = 0
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failures_to_open:
+                self.open_until = now + self.cooldown
+
+    def is_open(self):
+        return time.monotonic() < self.open_until
+
+    def recent(self):
+        """(p95 latency of successful calls, error rate, sample count) over the window"""
+        self._trim(time.monotonic())
+        latencies = [seconds for _, seconds, ok in self.samples if ok]
+        errors = sum(1 for _, _, ok in self.samples if not ok)
+        count = len(self.samples)
+        return _percentile(latencies, 95), (errors / count if count else 0.0), count
+
+class ModelRouter:
+    """Pick a model for each call and fall back to the others when it is slow or failing
+
+    `models` maps a tier name ("fast", "large") to a model id. Chat turns
+    go to the fast tier unless the prompt is longer than `long_prompt_chars`;
+    persona generation goes to the large tier. A tier whose circuit is open,
+    whose recent error rate is above `max_error_rate` or whose recent p95
+    latency is above its `latency_slo` is tried last. `call_fn(model_id,
+    prompt, **params)` returns the text, or None (or raises) on failure;
+    a failed call is retried on the next tier.
+    """
+
+    TASK_TIERS = {"chat": "fast", "persona": "large"}
+
+    def __init__(self, models, call_fn, stream_fn=None, long_prompt_chars=4000, latency_slo=None,
+                 max_error_rate=0.5, min_samples=5, health_window=60.0, failures_to_open=3, cooldown=30.0):
+        self.models = dict(models)
+        self.call_fn = call_fn
+        self.stream_fn = stream_fn
+        self.long_prompt_chars = long_prompt_chars
+        self.latency_slo = latency_slo or {}
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self.health = {tier: ModelHealth(health_window, failures_to_open, cooldown) for tier in self.models}
+        self.decisions = Counter()  # "task:tier:reason" -> count
+        self.escalations = 0
+
+    def _preferred_tier(self, task, prompt):
+        if task == "chat" and len(prompt) > self.long_prompt_chars and "large" in self.models:
+            return "large", "long_prompt"
+        tier = self.TASK_TIERS.get(task, "fast")
+        if tier not in self.models:
+            tier = next(iter(self.models))
+        return tier, "task"
+
+    def _degraded(self, tier):
+        """Why a tier should be avoided right now, or None"""
+        health = self.health[tier]
+        if health.is_open():
+            return "circuit_open"
+        p95, error_rate, count = health.recent()
+        if count >= self.min_samples and error_rate > self.max_error_rate:
+            return "errors"
+        slo = self.latency_slo.get(tier)
+        if slo and count >= self.min_samples and p95 > slo:
+            return "slow"
+        return None
+
+    def route(self, task, prompt):
+        """Tiers to try in order, and the reason the first one was picked"""
+        with self._lock:
+            preferred, reason = self._preferred_tier(task, prompt)
+            tiers = [preferred] + [tier for tier in self.models if tier != preferred]
+            healthy = [tier for tier in tiers if not self._degraded(tier)]
+            if healthy and healthy[0] != preferred:
+                reason = f"{preferred}_{self._degraded(preferred)}"
+            # Degraded tiers stay in the list as a last resort
+            order = healthy + [tier for tier in tiers if tier not in healthy]
+            self.decisions[f"{task}:{order[0]}:{reason}"] += 1
+            return order, reason
+
+    def _record(self, tier, started, ok):
+        with self._lock:
+            self.health[tier].record(time.perf_counter() - started, ok)
+
+    def generate(self, task, prompt, **params):
+        """Return the first successful response, or None if every tier failed"""
+        order, _ = self.route(task, prompt)
+        for attempt, tier in enumerate(order):
+            if attempt:
+                with self._lock:
+                    self.escalations += 1
+            started = time.perf_counter()
+            try:
+                text = self.call_fn(self.models[tier], prompt, **params)
+            except Exception as e:
+                print(f"Model {self.models[tier]} failed: {e}")
+                text = None
+            self._record(tier, started, bool(text))
+            if text:
+                return text
+        return None
+
+    def stream(self, task, prompt, **params):
+        """Yield response chunks; falls back to the next tier only if nothing was sent yet"""
+        order, _ = self.route(task, prompt)
+        for attempt, tier in enumerate(order):
+            if attempt:
+                with self._lock:
+                    self.escalations += 1
+            started = time.perf_counter()
+            sent = False
+            try:
+                for chunk in self.stream_fn(self.models[tier], prompt, **params):
+                    sent = True
+                    yield chunk
+            except GeneratorExit:
+                # The caller stopped reading, e.g. once it had a complete JSON object
+                self._record(tier, started, sent)
+                raise
+            except Exception as e:
+                print(f"Model {self.models[tier]} failed while streaming: {e}")
+                self._record(tier, started, False)
+                if sent:
+                    return
+                continue
+            self._record(tier, started, sent)
+            if sent:
+                return
+
+    def snapshot(self):
+        """Per-model latency and error stats plus routing decision counts, for /metrics"""
+        with self._lock:
+            models = {}
+            for tier, model_id in self.models.items():
+                health = self.health[tier]
+                p95, error_rate, count = health.recent()
+                latencies = [seconds for _, seconds, ok in health.samples if ok]
+                models[tier] = {
+                    "model": model_id,
+                    "calls": health.calls,
+                    "failures": health.failures,
+                    "recent_calls": count,
+                    "recent_error_rate": round(error_rate, 3),
+                    "p50_ms": round(1000 * _percentile(latencies, 50), 1),
+                    "p95_ms": round(1000 * p95, 1),
+                    "circuit_open": health.is_open(),
+                    "degraded": self._degraded(tier)
+                }
+            return {"models": models, "decisions": dict(self.decisions), "escalations": self.escalations}
@@ -2,9 +2,11 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-import json
+from db_config import RoutingSession
+from column_types import CompressedText, PersonaType
 
-db = SQLAlchemy()
+# Reads go to the replica bind when one is configured (see db_config.py)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class User(db.Model, UserMixin):
     """User model for authentication"""
@@ -14,8 +16,8 @@ class User(db.Model, UserMixin):
     password_hash = db.Column(db.String(128))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Relationship with chat sessions
-    chat_sessions = db.relationship('ChatSession', back_populates='user', cascade='all, delete-orphan')
+    # Relationship with chat sessions (rows are removed by ON DELETE CASCADE in the database)
+    chat_sessions = db.relationship('ChatSession', back_populates='user', cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
         """Set password hash"""
@@ -31,7 +33,7 @@ class User(db.Model, UserMixin):
 class ChatSession(db.Model):
     """Model for storing chat sessions"""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
     object_name = db.Column(db.String(64), nullable=False)
     title = db.Column(db.String(128))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -39,35 +41,33 @@ class ChatSession(db.Model):
     
     # Relationships
     user = db.relationship('User', back_populates='chat_sessions')
-    messages = db.relationship('ChatMessage', back_populates='chat_session', cascade='all, delete-orphan', order_by='ChatMessage.timestamp')
+    messages = db.relationship('ChatMessage', back_populates='chat_session', cascade='all, delete-orphan', passive_deletes=True, order_by='ChatMessage.timestamp')
     
-    # Object persona stored as JSON
-    _persona = db.Column(db.Text)
+    # Object persona in a compact binary encoding, decoded once when the row is loaded
+    _persona = db.Column(PersonaType)
     
     @property
     def persona(self):
         """Get the persona as a dictionary"""
-        if self._persona:
-            return json.loads(self._persona)
-        return None
+        return self._persona
     
     @persona.setter
     def persona(self, value):
-        """Store the persona as JSON"""
-        if value is None:
-            self._persona = None
-        else:
-            self._persona = json.dumps(value)
+        """Store the persona; it is encoded when the session is flushed"""
+        self._persona = dict(value) if value is not None else None
     
     def __repr__(self):
         return f'<ChatSession {self.id}: {self.object_name}>'
 
 class ChatMessage(db.Model):
     """Model for storing individual chat messages"""
+    # Never reuse ids on SQLite: archived messages keep theirs, and exports resume by id
+    __table_args__ = {"sqlite_autoincrement": True}
+    
     id = db.Column(db.Integer, primary_key=True)
-    chat_session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id'), nullable=False)
+    chat_session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id', ondelete='CASCADE'), nullable=False, index=True)
     role = db.Column(db.String(20), nullable=False)  # 'user' or 'assistant'
-    content = db.Column(db.Text, nullable=False)
+    content = db.Column(CompressedText(), nullable=False)  # zlib-compressed above 256 bytes
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship
@@ -75,3 +75,49 @@ class ChatMessage(db.Model):
     
     def __repr__(self):
         return f'<ChatMessage {self.id}: {self.role}>'
+
+class ChatArchive(db.Model):
+    """Compressed messages of a chat session that has been idle for a long time"""
+    chat_session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id', ondelete='CASCADE'), primary_key=True)
+    message_count = db.Column(db.Integer, nullable=False)
+    raw_size = db.Column(db.Integer, nullable=False)  # bytes of message content before compression
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON list of messages
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ChatArchive {self.chat_session_id}: {self.message_count} messages>'
+
+# Rollups maintained incrementally by analytics.py
+
+class ObjectPopularity(db.Model):
+    """Chats started with an object on one day"""
+    object_name = db.Column(db.String(64), primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    chat_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ObjectPopularity {self.object_name} {self.day}: {self.chat_count}>'
+
+class UserObject(db.Model):
+    """An object a user has chatted with, so co-occurrence counts each user once"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    object_name = db.Column(db.String(64), primary_key=True)
+    first_chat_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserObject {self.user_id}: {self.object_name}>'
+
+class ObjectCooccurrence(db.Model):
+    """Number of users who chatted with both objects (stored in both directions)"""
+    object_name = db.Column(db.String(64), primary_key=True)
+    related_name = db.Column(db.String(64), primary_key=True)
+    user_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ObjectCooccurrence {self.object_name} -> {self.related_name}: {self.user_count}>'
+
+class AnalyticsWatermark(db.Model):
+    """How far an incremental job has read through its source table"""
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
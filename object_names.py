@@ -0,0 +1,200 @@
+import re
+import bisect
+import threading
+
+# Leading words that don't change which object the user wants to talk to
+LEADING_WORDS = {"a", "an", "the", "my", "your", "our", "this", "that", "some", "one"}
+
+# Words that look plural but aren't (or whose singular would be wrong)
+PLURAL_EXCEPTIONS = {
+    "glass", "glasses", "scissors", "pants", "jeans", "shorts", "headphones",
+    "binoculars", "tongs", "pliers", "news", "series", "species", "bus", "gas",
+    "lens", "cactus", "octopus", "compass", "dress", "mattress", "chess"
+}
+
+# Irregular plurals we are likely to see in object names
+IRREGULAR_PLURALS = {
+    "knives": "knife",
+    "leaves": "leaf",
+    "shelves": "shelf",
+    "loaves": "loaf",
+    "mice": "mouse",
+    "teeth": "tooth",
+    "feet": "foot",
+    "geese": "goose",
+    "dice": "die"
+}
+
+# Alternative names that should share a persona with a canonical object
+OBJECT_SYNONYMS = {
+    "fridge": "refrigerator",
+    "icebox": "refrigerator",
+    "mug": "coffee mug",
+    "coffee cup": "coffee mug",
+    "ballpoint pen": "pen",
+    "ballpoint": "pen",
+    "novel": "book",
+    "paperback": "book",
+    "hardcover": "book",
+    "desk lamp": "lamp",
+    "table lamp": "lamp",
+    "floor lamp": "lamp",
+    "wall clock": "clock",
+    "alarm clock": "clock",
+    "looking glass": "mirror",
+    "armchair": "chair",
+    "office chair": "chair"
+}
+
+def singularize(word):
+    """Return a best-effort singular form of a single word"""
+    if word in PLURAL_EXCEPTIONS or len(word) <= 3:
+        return word
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+def normalize_object_name(text):
+    """Normalize an object name so equivalent spellings share one cache key"""
+    if not text:
+        return ""
+    text = text.lower()
+    # Drop punctuation but keep hyphens and apostrophes inside words
+    text = re.sub(r"[^\w\s'-]", " ", text)
+    words = [w.strip("'-_") for w in text.split()]
+    words = [w for w in words if w]
+    while words and words[0] in LEADING_WORDS:
+        words = words[1:]
+    if not words:
+        return ""
+    # Only the head noun is pluralized ("coffee mugs" -> "coffee mug")
+    words[-1] = singularize(words[-1])
+    name = " ".join(words)
+    return OBJECT_SYNONYMS.get(name, name)
+
+def parse_chat_command(message):
+    """Return the normalized object name for a 'chat with X' message, or None"""
+    match = re.match(r"\s*chat\s+with\b(.*)$", message or "", re.IGNORECASE | re.DOTALL)
+    if not match:
+        return None
+    return normalize_object_name(match.group(1))
+
+def _trigrams(text):
+    """Return the set of character trigrams for a padded string"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings"""
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+def _max_typos(word):
+    # Short words are too easily another object ("pen" / "pan"), so they must match exactly
+    if len(word) < 5:
+        return 0
+    return 1 if len(word) < 9 else 2
+
+def is_typo_of(name, candidate):
+    """Whether `name` is a misspelling of `candidate` rather than a different object
+
+    Both must have the same number of words and each word may only be a
+    small edit away, so "refrigerator magnet" or "toaster oven" don't match
+    "refrigerator" or "toaster".
+    """
+    words, candidate_words = name.split(), candidate.split()
+    if len(words) != len(candidate_words):
+        return False
+    return all(edit_distance(word, other) <= _max_typos(other) for word, other in zip(words, candidate_words))
+
+class PersonaIndex:
+    """In-memory trigram and prefix index over the names of known personas"""
+
+    def __init__(self, names=(), threshold=0.5):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._names = set()
+        self._sorted_names = []
+        self._trigram_index = {}
+        self._trigram_counts = {}
+        self.stats = {"exact": 0, "fuzzy": 0, "miss": 0}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        """Add a normalized name to the index"""
+        if not name:
+            return
+        with self._lock:
+            if name in self._names:
+                return
+            self._names.add(name)
+            bisect.insort(self._sorted_names, name)
+            grams = _trigrams(name)
+            self._trigram_counts[name] = len(grams)
+            for gram in grams:
+                self._trigram_index.setdefault(gram, set()).add(name)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __len__(self):
+        return len(self._names)
+
+    def complete(self, prefix, limit=10):
+        """Return up to `limit` known names starting with `prefix`"""
+        prefix = (prefix or "").lower()
+        with self._lock:
+            start = bisect.bisect_left(self._sorted_names, prefix)
+            results = []
+            for name in self._sorted_names[start:]:
+                if not name.startswith(prefix) or len(results) >= limit:
+                    break
+                results.append(name)
+            return results
+
+    def resolve(self, name):
+        """Return the known name that `name` is a misspelling of, or None
+
+        Exact matches win. Otherwise candidates with a trigram Dice similarity
+        at or above the threshold are tried best first, and the first one
+        that is only a typo away (see `is_typo_of`) is returned.
+        """
+        if not name:
+            return None
+        if name in self._names:
+            self.stats["exact"] += 1
+            return name
+
+        grams = _trigrams(name)
+        shared = {}
+        with self._lock:
+            for gram in grams:
+                for candidate in self._trigram_index.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            scored = sorted(
+                (-2.0 * count / (len(grams) + self._trigram_counts[candidate]), candidate)
+                for candidate, count in shared.items()
+            )
+
+        for negative_score, candidate in scored:
+            if -negative_score < self.threshold:
+                break
+            if is_typo_of(name, candidate):
+                self.stats["fuzzy"] += 1
+                return candidate
+        self.stats["miss"] += 1
+        return None
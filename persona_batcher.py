@@ -0,0 +1,137 @@
+import json
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from object_names import normalize_object_name
+from persona_schema import parse_json, validate_persona
+
+def build_batch_prompt(object_names):
+    """Build one prompt asking the model for personas for several objects"""
+    return f"""Create personas for each of the following objects that will be used in a conversational AI application.
+    Objects: {json.dumps(object_names)}
+
+    For each object the persona should include:
+    1. A tone (e.g., friendly, formal, quirky, etc.)
+    2. A list of 3-5 personality traits
+    3. A brief introduction message (1-2 sentences) that the object would say to introduce itself
+
+    Format your response exactly like this JSON array, with one entry per object in the same order:
+    [{{"object": "[object name]", "tone": "[tone]", "traits": ["trait1", "trait2", "trait3"], "introduction": "[introduction message]"}}]
+
+    Be creative and think about the physical properties, typical uses, and cultural associations of each object.
+    """
+
+def parse_batch_response(response_text, object_names):
+    """Map each requested object name to its persona from a batch response
+
+    Entries are matched on their "object" field, falling back to position
+    when the model left it out. Objects without a complete, valid entry are
+    omitted, so they are retried on their own.
+    """
+    entries = parse_json(response_text)
+    if not isinstance(entries, list):
+        return {}
+
+    wanted = {normalize_object_name(name): name for name in object_names}
+    personas = {}
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        persona, missing = validate_persona(entry)
+        if missing:
+            continue
+        name = wanted.get(normalize_object_name(str(entry.get("object", ""))))
+        if name is None and position < len(object_names):
+            name = object_names[position]
+        if name is not None and name not in personas:
+            personas[name] = persona
+    return personas
+
+class PersonaBatcher:
+    """Collect persona requests for a short window and generate them in one model call
+
+    `batch_fn(names)` returns a dict of name -> persona for one combined call
+    and `single_fn(name)` generates one persona on its own. Objects missing
+    from a batch result are retried individually with `single_fn`.
+    """
+
+    def __init__(self, batch_fn, single_fn, window=0.05, max_batch=8, workers=8, timeout=30.0):
+        self.batch_fn = batch_fn
+        self.single_fn = single_fn
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._pending = {}  # object name -> Future, in arrival order
+        self._first_arrival = None
+        self._thread = None
+        self._executor = None
+        self.stats = {"requests": 0, "batches": 0, "batched_objects": 0, "single_calls": 0, "failures": 0}
+
+    def _ensure_started(self):
+        # Started lazily so each gunicorn worker gets its own thread after fork
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="persona-batch")
+            self._thread = threading.Thread(target=self._run, name="persona-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, object_name):
+        """Queue a persona request and return a Future for its result"""
+        with self._cond:
+            self._ensure_started()
+            self.stats["requests"] += 1
+            future = self._pending.get(object_name)
+            if future is None:
+                future = Future()
+                self._pending[object_name] = future
+                if self._first_arrival is None:
+                    self._first_arrival = time.monotonic()
+                self._cond.notify()
+            return future
+
+    def get(self, object_name):
+        """Return the generated persona for an object, or None if generation failed"""
+        return self.submit(object_name).result(timeout=self.timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Wait out the window unless the batch fills up first
+                while len(self._pending) < self.max_batch:
+                    remaining = self._first_arrival + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                names = list(self._pending)[:self.max_batch]
+                batch = {name: self._pending.pop(name) for name in names}
+                self._first_arrival = time.monotonic() if self._pending else None
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch):
+        names = list(batch)
+        results = {}
+        if len(names) > 1:
+            self.stats["batches"] += 1
+            try:
+                results = self.batch_fn(names) or {}
+            except Exception as e:
+                print(f"Error generating persona batch for {names}: {e}")
+            self.stats["batched_objects"] += len(results)
+
+        for name, future in batch.items():
+            persona = results.get(name)
+            if persona is None:
+                # Partial failure (or a batch of one): fall back to an individual call
+                self.stats["single_calls"] += 1
+                try:
+                    persona = self.single_fn(name)
+                except Exception as e:
+                    print(f"Error generating persona for {name}: {e}")
+                    persona = None
+            if persona is None:
+                self.stats["failures"] += 1
+            future.set_result(persona)
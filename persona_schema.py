@@ -0,0 +1,175 @@
+import json
+
+PERSONA_FIELDS = ("tone", "traits", "introduction")
+
+# Limits beyond which a field is treated as the model rambling rather than a value
+MAX_TONE_CHARS = 80
+MAX_TRAIT_CHARS = 40
+MAX_TRAITS = 5
+MAX_INTRODUCTION_CHARS = 500
+
+_FIELD_SCHEMAS = {
+    "tone": {"type": "STRING"},
+    "traits": {"type": "ARRAY", "items": {"type": "STRING"}},
+    "introduction": {"type": "STRING"}
+}
+
+def persona_schema(fields=PERSONA_FIELDS):
+    """Response schema for a JSON object with the given persona fields"""
+    return {
+        "type": "OBJECT",
+        "properties": {field: _FIELD_SCHEMAS[field] for field in fields},
+        "required": list(fields)
+    }
+
+# One persona per requested object, in request order
+PERSONA_BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": dict({"object": {"type": "STRING"}}, **_FIELD_SCHEMAS),
+        "required": ["object"] + list(PERSONA_FIELDS)
+    }
+}
+
+class JsonStreamParser:
+    """Find the first complete JSON object or array in text that arrives in pieces
+
+    `feed` returns the parsed value as soon as its closing bracket arrives,
+    so the caller can stop reading the model's stream there. Text before
+    the value (prose, code fences) is skipped. If the stream ends first,
+    `salvage` recovers the members of a top-level object that were complete.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.value = None
+        self.done = False
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._last_comma = None  # offset of the last comma between top-level members
+
+    def _restart(self, after):
+        self._pos = after
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._last_comma = None
+
+    def feed(self, chunk):
+        """Add text; returns the value once the first object or array is complete, else None"""
+        if self.done:
+            return self.value
+        self.text += chunk
+        i = self._pos
+        while i < len(self.text):
+            ch = self.text[i]
+            i += 1
+            if self._start is None:
+                if ch in "{[":
+                    self._start = i - 1
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        self.value = json.loads(self.text[self._start:i])
+                    except ValueError:
+                        # Brackets in prose, like "[tone]"; keep looking after the opening one
+                        i = self._start + 1
+                        self._restart(i)
+                        continue
+                    self.done = True
+                    self._pos = i
+                    return self.value
+            elif ch == "," and self._depth == 1:
+                self._last_comma = i - 1
+        self._pos = i
+        return None
+
+    def salvage(self):
+        """Members of a top-level object cut short by the end of the stream, as a dict"""
+        if self.done:
+            return self.value
+        if self._start is None or self.text[self._start] != "{":
+            return {}
+        candidates = []
+        if not self._in_string:
+            # Cut right after a complete member
+            candidates.append(self.text[self._start:].rstrip().rstrip(",") + "}")
+        if self._last_comma is not None:
+            candidates.append(self.text[self._start:self._last_comma] + "}")
+        for candidate in candidates:
+            try:
+                value = json.loads(candidate)
+            except ValueError:
+                continue
+            if isinstance(value, dict):
+                return value
+        return {}
+
+def parse_json(text):
+    """First complete JSON object or array in a model response, or None"""
+    parser = JsonStreamParser()
+    return parser.feed(text or "")
+
+def validate_persona(data, fields=PERSONA_FIELDS):
+    """Split model output into usable persona fields and the names of the missing or invalid ones"""
+    persona = {}
+    if isinstance(data, dict):
+        tone = data.get("tone")
+        if isinstance(tone, str) and 0 < len(tone.strip()) <= MAX_TONE_CHARS:
+            persona["tone"] = tone.strip()
+        traits = data.get("traits")
+        if isinstance(traits, str):
+            traits = traits.split(",")
+        if isinstance(traits, list):
+            traits = [t.strip() for t in traits if isinstance(t, str) and 0 < len(t.strip()) <= MAX_TRAIT_CHARS]
+            if traits:
+                persona["traits"] = traits[:MAX_TRAITS]
+        introduction = data.get("introduction")
+        if isinstance(introduction, str) and 0 < len(introduction.strip()) <= MAX_INTRODUCTION_CHARS:
+            persona["introduction"] = introduction.strip()
+    persona = {field: persona[field] for field in fields if field in persona}
+    return persona, [field for field in fields if field not in persona]
+
+def build_persona_prompt(object_name):
+    """Prompt for a single persona"""
+    return f"""Create a persona for a {object_name} that will be used in a conversational AI application.
+    The persona should include:
+    1. A tone (e.g., friendly, formal, quirky, etc.)
+    2. A list of 3-5 personality traits
+    3. A brief introduction message (1-2 sentences) that the {object_name} would say to introduce itself
+
+    Format your response exactly like this JSON structure:
+    {{"tone": "[tone]", "traits": ["trait1", "trait2", "trait3"], "introduction": "[introduction message]"}}
+
+    Be creative and think about the physical properties, typical uses, and cultural associations of a {object_name}.
+    """
+
+def build_repair_prompt(object_name, persona, missing):
+    """Prompt asking only for the fields a previous reply left out or got wrong"""
+    return f"""Complete the persona for a {object_name} that will be used in a conversational AI application.
+    It already has: {json.dumps(persona)}
+    Reply with a JSON object containing only these fields: {json.dumps(list(missing))}
+    - "tone": a short tone (e.g., friendly, formal, quirky, etc.)
+    - "traits": a list of 3-5 one or two word personality traits
+    - "introduction": a brief introduction message (1-2 sentences) that the {object_name} would say to introduce itself
+    Keep it consistent with the fields it already has.
+    """
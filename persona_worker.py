@@ -0,0 +1,85 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class PersonaWorker:
+    """Generate personas in the background so chats can start with a fallback
+
+    `generate_fn(name)` returns a persona or None. Requests for an object that
+    is already being generated join the running job rather than starting
+    another one. When a persona is ready every listener is called with
+    `(name, persona, chat_session_ids)`, where the ids are the saved chats
+    that were waiting for it. After a failed job, `recently_failed` reports
+    the object for `retry_after` seconds so callers don't retry it on every
+    request.
+    """
+
+    def __init__(self, generate_fn, workers=4, retry_after=60.0, max_failures=10000):
+        self.generate_fn = generate_fn
+        self.workers = workers
+        self.retry_after = retry_after
+        self.max_failures = max_failures
+        self._lock = threading.Lock()
+        self._jobs = {}  # object name -> set of waiting chat session ids
+        self._failed = OrderedDict()  # object name -> monotonic time of its last failure
+        self._listeners = []
+        self._executor = None
+        self.stats = {"submitted": 0, "joined": 0, "completed": 0, "failed": 0}
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def is_pending(self, object_name):
+        with self._lock:
+            return object_name in self._jobs
+
+    def recently_failed(self, object_name):
+        with self._lock:
+            failed_at = self._failed.get(object_name)
+            return failed_at is not None and time.monotonic() - failed_at < self.retry_after
+
+    def submit(self, object_name, chat_session_id=None):
+        """Generate a persona in the background; returns False if a job was already running"""
+        with self._lock:
+            # Started lazily so each gunicorn worker gets its own threads after fork
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="persona-worker")
+            waiting = self._jobs.get(object_name)
+            started = waiting is None
+            if started:
+                waiting = self._jobs[object_name] = set()
+                self.stats["submitted"] += 1
+            else:
+                self.stats["joined"] += 1
+            if chat_session_id is not None:
+                waiting.add(chat_session_id)
+        if started:
+            self._executor.submit(self._run, object_name)
+        return started
+
+    def _run(self, object_name):
+        try:
+            persona = self.generate_fn(object_name)
+        except Exception as e:
+            print(f"Error generating persona for {object_name} in the background: {e}")
+            persona = None
+        with self._lock:
+            waiting = self._jobs.pop(object_name, set())
+            self.stats["completed" if persona else "failed"] += 1
+            self._failed.pop(object_name, None)
+            if not persona:
+                self._failed[object_name] = time.monotonic()
+                while len(self._failed) > self.max_failures:
+                    self._failed.popitem(last=False)
+        if not persona:
+            return
+        for listener in self._listeners:
+            try:
+                listener(object_name, persona, sorted(waiting))
+            except Exception as e:
+                print(f"Error delivering persona for {object_name}: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, pending=len(self._jobs))
@@ -0,0 +1,185 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import threading
+
+from flask import g, request
+
+PROFILE_ID_PATTERN = re.compile(r"^[\w-]+$")
+
+def _frame_label(code, root):
+    filename = code.co_filename
+    if filename.startswith(root):
+        filename = filename[len(root):].lstrip(os.sep)
+    else:
+        # Keep the package directory so e.g. flask/app.py isn't confused with our app.py
+        filename = os.path.join(os.path.basename(os.path.dirname(filename)), os.path.basename(filename))
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+class _RequestRecord:
+    """Stack samples collected for one in-flight request"""
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.stacks = {}
+        self.samples = 0
+        self.status = None
+
+class RequestProfiler:
+    """Stack-sampling profiler for Flask requests
+
+    While any request is in flight a background thread samples the stacks of
+    the threads serving requests every `interval` seconds. When a request
+    finishes its samples are kept if it was picked at random (`sample_rate`)
+    or took longer than `threshold_ms`, and are written as collapsed stacks
+    to a ring buffer of at most `max_profiles` files in `directory`.
+
+    A sampler is used rather than cProfile because whether a request is slow
+    is only known once it has finished, and cProfile must be switched on
+    up front.
+
+    Requests whose path starts with one of `exclude_paths` are not profiled,
+    e.g. WebSocket connections, which stay open for the whole chat and would
+    otherwise always be recorded as slow.
+    """
+
+    def __init__(self, directory, sample_rate=0.01, threshold_ms=1000, interval=0.005, max_profiles=50,
+                 exclude_paths=()):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self.exclude_paths = tuple(exclude_paths)
+        self.root = os.path.dirname(os.path.abspath(__file__))
+        self._active = {}  # thread id -> _RequestRecord
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish_request)
+
+    def _ensure_sampler(self):
+        # Started lazily so each gunicorn worker gets its own thread after fork
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+            self._thread.start()
+
+    def _start_request(self):
+        if self.exclude_paths and request.path.startswith(self.exclude_paths):
+            return
+        record = _RequestRecord(sampled=random.random() < self.sample_rate)
+        g._profile_record = record
+        with self._lock:
+            self._ensure_sampler()
+            self._active[threading.get_ident()] = record
+        self._wakeup.set()
+
+    def _record_status(self, response):
+        record = g.get("_profile_record")
+        if record is not None:
+            record.status = response.status_code
+        return response
+
+    def _finish_request(self, exc=None):
+        with self._lock:
+            record = self._active.pop(threading.get_ident(), None)
+            if not self._active:
+                self._wakeup.clear()
+            if record is None:
+                return
+            # The sampler may still hold this record; it only adds samples under the lock
+            stacks, samples = dict(record.stacks), record.samples
+        duration_ms = 1000 * (time.perf_counter() - record.started)
+        slow = duration_ms >= self.threshold_ms
+        if (slow or record.sampled) and samples:
+            try:
+                self._save(record, stacks, samples, duration_ms, "slow" if slow else "sampled", exc)
+            except OSError as e:
+                print(f"Error saving request profile: {e}")
+
+    def _sample_loop(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, record in active.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code, self.root))
+                    frame = frame.f_back
+                if stack:
+                    samples.append((record, ";".join(reversed(stack))))
+            with self._lock:
+                for record, key in samples:
+                    record.stacks[key] = record.stacks.get(key, 0) + 1
+                    record.samples += 1
+
+    def _save(self, record, stacks, samples, duration_ms, reason, exc):
+        profile_id = f"{time.time_ns()}-{os.getpid()}"
+        profile = {
+            "id": profile_id,
+            "timestamp": time.time(),
+            "method": request.method,
+            "path": request.path,
+            "status": record.status if exc is None else 500,
+            "duration_ms": round(duration_ms, 2),
+            "reason": reason,
+            "samples": samples,
+            "interval_ms": 1000 * self.interval,
+            "stacks": stacks
+        }
+        path = os.path.join(self.directory, f"{profile_id}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(profile, f)
+        os.replace(path + ".tmp", path)
+        self._trim()
+
+    def _trim(self):
+        """Delete the oldest profiles beyond max_profiles"""
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(".json"))
+        for name in names[:-self.max_profiles]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass  # another worker got there first
+
+    def list_profiles(self):
+        """Summaries of stored profiles, newest first"""
+        summaries = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if not name.endswith(".json"):
+                continue
+            profile = self.load_profile(name[:-len(".json")])
+            if profile is not None:
+                profile.pop("stacks", None)
+                summaries.append(profile)
+        return summaries
+
+    def load_profile(self, profile_id):
+        """Return a stored profile, or None if it doesn't exist (or was rotated out)"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+def collapsed_stacks(profile):
+    """Render a profile in the collapsed-stack format used by flamegraph.pl and speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(profile["stacks"].items()))
@@ -0,0 +1,76 @@
+import time
+import argparse
+from sqlalchemy import select, delete, func, inspect
+from models import db, User, ChatSession, ChatMessage
+
+def purge_chat_session(chat_session_id, batch_size=1000, pause=0.0):
+    """Delete a chat session's messages in small batches, then the session itself
+
+    Each batch is its own short transaction, so a session with a huge number
+    of messages never holds locks for long. Returns the number of messages deleted.
+    """
+    deleted = 0
+    while True:
+        # Read from the primary: a lagging replica would keep returning rows already deleted
+        ids = db.session.execute(
+            select(ChatMessage.id).where(ChatMessage.chat_session_id == chat_session_id).limit(batch_size),
+            bind_arguments={"bind": db.engine}
+        ).scalars().all()
+        if not ids:
+            break
+        deleted += db.session.execute(
+            delete(ChatMessage).where(ChatMessage.id.in_(ids)), execution_options={"synchronize_session": False}
+        ).rowcount
+        db.session.commit()
+        if pause:
+            time.sleep(pause)
+
+    db.session.execute(delete(ChatSession).where(ChatSession.id == chat_session_id), execution_options={"synchronize_session": False})
+    db.session.commit()
+    return deleted
+
+def purge_user(user_id, batch_size=1000, pause=0.0):
+    """Delete every chat of a user batch by batch, then the user"""
+    session_ids = db.session.execute(
+        select(ChatSession.id).where(ChatSession.user_id == user_id)
+    ).scalars().all()
+    deleted = 0
+    for chat_session_id in session_ids:
+        deleted += purge_chat_session(chat_session_id, batch_size, pause)
+
+    db.session.execute(delete(User).where(User.id == user_id), execution_options={"synchronize_session": False})
+    db.session.commit()
+    return len(session_ids), deleted
+
+def cascades_enabled(engine):
+    """Whether the database deletes a chat's messages with it (migrate_cascades.py has run)"""
+    for fk in inspect(engine).get_foreign_keys(ChatMessage.__tablename__):
+        if fk["constrained_columns"] == ["chat_session_id"]:
+            return (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE"
+    return False
+
+def count_messages(chat_session_id):
+    return db.session.execute(
+        select(func.count(ChatMessage.id)).where(ChatMessage.chat_session_id == chat_session_id)
+    ).scalar()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Delete large chat sessions or whole accounts in small batches")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--session", type=int, help="chat session id to delete")
+    target.add_argument("--user", help="username whose account and chats should be deleted")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.session:
+            deleted = purge_chat_session(args.session, args.batch_size, args.pause)
+            print(f"Deleted chat session {args.session} and {deleted} messages")
+        else:
+            user = User.query.filter_by(username=args.user).first()
+            if not user:
+                raise SystemExit(f"User {args.user} not found")
+            sessions, messages = purge_user(user.id, args.batch_size, args.pause)
+            print(f"Deleted user {args.user}, {sessions} chat sessions and {messages} messages")
@@ -0,0 +1,78 @@
+import re
+import json
+import time
+import random
+import threading
+
+class StubModelError(Exception):
+    """Simulated backend failure"""
+
+class StubModel:
+    """Local stand-in for the Gemini backend, used for benchmarks and offline runs
+
+    Latency is modelled as a fixed per-call cost plus a cost per output
+    token, which is what makes batching and routing worth measuring.
+    """
+
+    def __init__(self, latency=0.3, per_token_latency=0.002, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.per_token_latency = per_token_latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.output_tokens = 0
+
+    def _persona(self, object_name):
+        return {
+            "tone": self._random.choice(["friendly", "quirky", "wise", "dramatic", "cheerful"]),
+            "traits": self._random.sample(["sturdy", "curious", "patient", "witty", "loyal", "proud", "calm"], 3),
+            "introduction": f"Hello! I'm a {object_name}, and I've been waiting for someone to talk to."
+        }
+
+    def _respond(self, prompt):
+        batch = re.search(r'Objects:\s*(\[.*?\])', prompt)
+        if batch:
+            names = json.loads(batch.group(1))
+            return json.dumps([dict(self._persona(name), object=name) for name in names])
+        repair = re.search(r'Complete the persona for an? (.+?) that will[\s\S]*only these fields: (\[.*?\])', prompt)
+        if repair:
+            persona = self._persona(repair.group(1))
+            return json.dumps({field: persona[field] for field in json.loads(repair.group(2))})
+        single = re.search(r'Create a persona for an? (.+?) that will', prompt)
+        if single:
+            return json.dumps(self._persona(single.group(1)))
+        subject = re.search(r'You are an? (.+?)\.', prompt)
+        subject = subject.group(1) if subject else "object"
+        return f"*creaks thoughtfully* As your trusty {subject}, I'd say that's a fine question. Ask me another!"
+
+    def generate(self, prompt, max_output_tokens=256):
+        """Return a canned response after a simulated model delay"""
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.failure_rate
+            text = self._respond(prompt)
+        tokens = min(max_output_tokens, max(1, len(text) // 4))
+        with self._lock:
+            self.output_tokens += tokens
+        time.sleep(self.latency + tokens * self.per_token_latency)
+        if failed:
+            raise StubModelError("simulated backend failure")
+        return text
+
+    def generate_stream(self, prompt, max_output_tokens=256):
+        """Yield a canned response word by word, paced like a streaming backend"""
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.failure_rate
+            text = self._respond(prompt)
+        text = text[:4 * max_output_tokens]
+        time.sleep(self.latency)
+        if failed:
+            raise StubModelError("simulated backend failure")
+        for word in re.findall(r'\S+\s*', text):
+            tokens = max(1, len(word) // 4)
+            with self._lock:
+                self.output_tokens += tokens
+            time.sleep(tokens * self.per_token_latency)
+            yield word
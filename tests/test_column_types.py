@@ -0,0 +1,49 @@
+"""Regression tests for the compressed column types
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import json
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, insert, select, text
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import column_types
+from column_types import CompressedText, PersonaType, encode_text, encode_persona
+
+PERSONA = {"tone": "wise", "traits": ["calm", "patient"], "introduction": "Hello, I am a teapot."}
+LONG_TEXT = "I have been steeping tea for forty years. " * 20
+
+def result(type_, value):
+    dialect = PGDialect_psycopg2()
+    return type_.dialect_impl(dialect).result_processor(dialect, None)(value)
+
+def test_text_column_not_yet_converted_reads_on_psycopg2():
+    # Before migrate_compression.py runs, PostgreSQL returns str from the text columns
+    assert result(CompressedText(), "hello") == "hello"
+    assert result(PersonaType(), json.dumps(PERSONA)) == PERSONA
+
+def test_bytea_column_reads_on_psycopg2():
+    assert result(CompressedText(), memoryview(encode_text(LONG_TEXT))) == LONG_TEXT
+    assert result(CompressedText(), memoryview(encode_text("hi"))) == "hi"
+    assert result(PersonaType(), memoryview(encode_persona(PERSONA))) == PERSONA
+
+@pytest.mark.parametrize("packed", [True, False])
+def test_round_trip(packed, monkeypatch):
+    monkeypatch.setitem(column_types.PACKED_WRITES, "text", packed)
+    monkeypatch.setitem(column_types.PACKED_WRITES, "persona", packed)
+    engine = create_engine("sqlite://")
+    table = Table("t", MetaData(), Column("id", Integer, primary_key=True),
+                  Column("content", CompressedText()), Column("persona", PersonaType()))
+    table.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(table), [{"id": 1, "content": LONG_TEXT, "persona": PERSONA},
+                                     {"id": 2, "content": "hi", "persona": None}])
+        # A row written before compression
+        conn.execute(text("INSERT INTO t (id, content, persona) VALUES (3, 'old', :p)"), {"p": json.dumps(PERSONA)})
+        rows = conn.execute(select(table.c.content, table.c.persona).order_by(table.c.id)).all()
+    assert [tuple(row) for row in rows] == [(LONG_TEXT, PERSONA), ("hi", None), ("old", PERSONA)]